@@ -0,0 +1,199 @@
+"""Install from asyncio, with one event loop driving many installs
+
+pip runs as a subprocess of the event loop, rather than a thread blocking
+on its output, whereas converting and deploying, which are bound by the
+filesystem, are handed to an executor.
+
+Python 3.5+ only, and as such not imported by pipz itself.
+
+Usage:
+    >>> import asyncio
+    >>> from pipz import aio
+    >>> async def main():
+    ...     semaphore = asyncio.Semaphore(8)  # pip processes at a time
+    ...     await asyncio.gather(*(
+    ...         aio.install_async([name], semaphore=semaphore)
+    ...         for name in ("six", "pyyaml", "mkdocs")
+    ...     ))
+
+"""
+
+import shlex
+import shutil
+import asyncio
+import tempfile
+import functools
+
+from . import pip, tracing
+
+__all__ = [
+    "call_async",
+    "download_async",
+    "install_async",
+]
+
+
+async def call_async(command, on_progress=None, max_output=200, **kwargs):
+    """Run `command`, streaming its output, see `pipz.pip.call`
+
+    Raises:
+        OSError: On `command` returning non-zero
+
+    """
+
+    if isinstance(command, str):
+        command = shlex.split(command)
+
+    with tracing.span("pip", command=command) as attrs:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            **kwargs
+        )
+
+        output = pip._Output(on_progress, max_output)
+
+        while True:
+            line = await process.stdout.readline()
+
+            if not line:
+                break
+
+            output.feed(line.decode("utf-8", "replace"))
+
+        attrs["returncode"] = await process.wait()
+
+    if attrs["returncode"] != 0:
+        raise output.error(command)
+
+
+async def download_async(names,
+                         tempdir=None,
+                         index=None,
+                         extra_args=None,
+                         cache=None,
+                         on_progress=None,
+                         direct=False,
+                         python=None,
+                         platform=None,
+                         semaphore=None,
+                         executor=None):
+    """Gather pip packages in `tempdir`, see `pipz.pip.download`
+
+    Arguments:
+        semaphore (asyncio.Semaphore, optional): Held whilst pip runs,
+            bounding the number of pip processes shared by its users
+        executor (concurrent.futures.Executor, optional): Runs what
+            reads the filesystem, defaults to that of the event loop
+
+    """
+
+    loop = asyncio.get_event_loop()
+
+    # The cache and pip's output are read from disk
+    job = await loop.run_in_executor(executor, functools.partial(
+        pip._Download,
+        names,
+        tempdir=tempdir,
+        index=index,
+        extra_args=extra_args,
+        cache=cache,
+        direct=direct,
+        python=python,
+        platform=platform,
+    ))
+
+    if job.distributions is not None:
+        return job.distributions
+
+    if semaphore is not None:
+        await semaphore.acquire()
+
+    try:
+        await call_async(job.command, on_progress=on_progress)
+
+    except Exception:
+        job.discard()
+        raise
+
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+
+    await loop.run_in_executor(executor, job.complete)
+
+    return job.distributions
+
+
+async def install_async(names,
+                        prefix=None,
+                        release=False,
+                        variants=None,
+                        index=None,
+                        extra_args=None,
+                        jobs=1,
+                        transfer="copy",
+                        store=None,
+                        cache=None,
+                        paths=None,
+                        on_progress=None,
+                        direct=False,
+                        compile=False,
+                        zipped=False,
+                        semaphore=None,
+                        executor=None):
+    """Install `names` as Rez packages, see `pipz.pip.install`
+
+    Arguments:
+        semaphore (asyncio.Semaphore, optional): Held whilst pip runs,
+            see `download_async`
+        executor (concurrent.futures.Executor, optional): Converts and
+            deploys packages, defaults to that of the event loop
+
+    Returns:
+        packages (list): Newly installed packages
+
+    Raises:
+        OSError: On pip failing, or any package failing to deploy
+
+    """
+
+    from rez.config import config
+
+    assert isinstance(names, (tuple, list)), "%s was not list or tuple" % names
+
+    loop = asyncio.get_event_loop()
+    packagesdir = prefix or (
+        config.release_packages_path if release
+        else config.local_packages_path
+    )
+
+    tempdir = tempfile.mkdtemp(suffix="-rez", prefix="pip-")
+
+    try:
+        distributions = await download_async(names,
+                                             tempdir=tempdir,
+                                             index=index,
+                                             extra_args=extra_args,
+                                             cache=cache,
+                                             on_progress=on_progress,
+                                             direct=direct,
+                                             semaphore=semaphore,
+                                             executor=executor)
+
+        return await loop.run_in_executor(executor, functools.partial(
+            pip._install_distributions,
+            distributions,
+            packagesdir=packagesdir,
+            variants=variants,
+            paths=paths,
+            jobs=jobs,
+            transfer=transfer,
+            store=store,
+            compile=compile,
+            zipped=zipped,
+        ))
+
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
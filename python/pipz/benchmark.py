@@ -0,0 +1,371 @@
+"""Benchmark each stage of an install, offline, with synthetic wheels
+
+Wheels are generated locally, pure-Python and platform-specific, with
+anything from a handful to tens of thousands of files and with or
+without entry points. Each stage is then timed separately.
+
+Usage:
+    $ python -m pipz.benchmark --output 1.3.0.json
+    $ python -m pipz.benchmark --compare 1.3.0.json
+
+"""
+
+import os
+import sys
+import json
+import time
+import stat
+import shutil
+import base64
+import hashlib
+import zipfile
+import argparse
+import tempfile
+
+from . import pip
+from .version import version
+
+_timer = getattr(time, "perf_counter", time.time)
+
+# Files per wheel, each size is run with and without purelib and entry points
+default_sizes = [10, 1000, 50000]
+
+
+def make_wheel(directory,
+               name,
+               version="1.0",
+               files=10,
+               purelib=True,
+               entry_points=False,
+               requires=None,
+               file_size=1024):
+    """Write a wheel of `files` Python modules to `directory`
+
+    Arguments:
+        directory (str): Absolute path to output directory
+        name (str): Name of distribution, e.g. "mypackage"
+        version (str, optional): Version of distribution
+        files (int, optional): Number of modules, spread across
+            sub-packages of 100 modules each
+        purelib (bool, optional): Whether the wheel is pure-Python,
+            otherwise it's tagged for the currently running interpreter
+        entry_points (bool, optional): Include a console script
+        requires (list, optional): Requires-Dist of the wheel
+        file_size (int, optional): Bytes per module
+
+    Returns:
+        fname (str): Absolute path to wheel
+
+    """
+
+    if purelib:
+        tag = "py2.py3-none-any"
+        tags = ["py2-none-any", "py3-none-any"]
+    else:
+        tag = pip.probe()["tags"][0]
+        tags = [tag]
+
+    dist_info = "%s-%s.dist-info" % (name, version)
+    fname = os.path.join(directory, "%s-%s-%s.whl" % (name, version, tag))
+
+    members = list()
+
+    for index in range(files):
+        package = "%s/sub%d" % (name, index // 100)
+        module = "%s/module%d.py" % (package, index)
+
+        if index % 100 == 0:
+            members.append(("%s/__init__.py" % package, b""))
+
+        body = b"# %d\n" % index
+        members.append((module, body + b"x = 1\n" * (
+            max(0, file_size - len(body)) // 6)))
+
+    members.append(("%s/__init__.py" % name, b"def main():\n    pass\n"))
+
+    metadata = [
+        "Metadata-Version: 2.1",
+        "Name: %s" % name,
+        "Version: %s" % version,
+    ] + ["Requires-Dist: %s" % req for req in requires or []]
+
+    members.append(("%s/METADATA" % dist_info, "\n".join(metadata) + "\n"))
+    members.append(("%s/WHEEL" % dist_info, "\n".join([
+        "Wheel-Version: 1.0",
+        "Generator: pipz.benchmark",
+        "Root-Is-Purelib: %s" % ("true" if purelib else "false"),
+    ] + ["Tag: %s" % t for t in tags]) + "\n"))
+
+    if entry_points:
+        members.append(("%s/entry_points.txt" % dist_info, "\n".join([
+            "[console_scripts]",
+            "%s = %s:main" % (name, name),
+        ]) + "\n"))
+
+    record = list()
+
+    with zipfile.ZipFile(fname, "w", zipfile.ZIP_DEFLATED) as whl:
+        for member, data in members:
+            if not isinstance(data, bytes):
+                data = data.encode("utf-8")
+
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest())
+            record.append("%s,sha256=%s,%d" % (
+                member, digest.decode("ascii").rstrip("="), len(data)
+            ))
+
+            whl.writestr(member, data)
+
+        record.append("%s/RECORD,," % dist_info)
+        whl.writestr("%s/RECORD" % dist_info, "\n".join(record) + "\n")
+
+    return fname
+
+
+def measure(func, repeat):
+    """Call `func` `repeat` times, returning min, mean and max seconds
+
+    `func` is given the index of the current repetition.
+
+    """
+
+    durations = list()
+
+    for index in range(repeat):
+        t0 = _timer()
+        func(index)
+        durations.append(_timer() - t0)
+
+    return {
+        "min": min(durations),
+        "mean": sum(durations) / len(durations),
+        "max": max(durations),
+        "repeat": repeat,
+    }
+
+
+def run(sizes=None, repeat=3, tempdir=None, log=None):
+    """Benchmark each stage against every synthetic wheel
+
+    Arguments:
+        sizes (list, optional): Number of files per wheel,
+            defaults to 10, 1000 and 50,000
+        repeat (int, optional): Times each stage is measured
+        tempdir (str, optional): Where to write wheels and packages
+        log (callable, optional): Called with progress messages
+
+    Returns:
+        results (dict): Environment and results, suitable for JSON
+
+    """
+
+    log = log or (lambda msg: None)
+    root = tempdir or tempfile.mkdtemp(prefix="pipz-benchmark-")
+    wheelhouse = os.path.join(root, "wheelhouse")
+    os.makedirs(wheelhouse)
+
+    results = list()
+
+    try:
+        for files in sizes or default_sizes:
+            for purelib in (True, False):
+                for entry_points in (False, True):
+                    case = "%s-%d%s" % (
+                        "pure" if purelib else "platform",
+                        files,
+                        "-entrypoints" if entry_points else "",
+                    )
+
+                    log("Benchmarking %s.." % case)
+
+                    results.extend(_run_case(
+                        root, wheelhouse, case, files, purelib,
+                        entry_points, repeat
+                    ))
+
+    finally:
+        if tempdir is None:
+            _rmtree(root)
+
+    return {
+        "pipz": version,
+        "python": pip.python_version(),
+        "pip": pip.pip_version(),
+        "platform": sys.platform,
+        "results": results,
+    }
+
+
+def _run_case(root, wheelhouse, case, files, purelib, entry_points, repeat):
+    name = "pipzbench_%s" % case.replace("-", "_")
+
+    fname = make_wheel(wheelhouse, name,
+                       files=files,
+                       purelib=purelib,
+                       entry_points=entry_points,
+                       requires=["six>=1.0", "pyyaml==5.1"])
+
+    with zipfile.ZipFile(fname) as whl:
+        WHEEL = whl.read("%s-1.0.dist-info/WHEEL" % name).decode("utf-8")
+
+    staging = os.path.join(root, case, "staging-%d")
+    repos = os.path.join(root, case, "repository-%d")
+    state = {}
+
+    def download(index):
+        state["dist"] = pip.download([name],
+                                     tempdir=staging % index,
+                                     index=wheelhouse,
+                                     extra_args=["--no-deps"])[0]
+
+    def convert(index):
+        state["package"] = pip.convert(state["dist"])
+
+    def requirements(index):
+        pip._pip_to_rez_requirements(state["dist"])
+
+    def wheel_to_variants(index):
+        pip.wheel_to_variants(WHEEL)
+
+    def deploy(index):
+        pip.deploy(state["package"], path=repos % index)
+
+    def exists(index):
+        pip.exists_all([state["package"]], [repos % 0])
+
+    stages = [
+        ("download", download),
+        ("convert", convert),
+        ("_pip_to_rez_requirements", requirements),
+        ("wheel_to_variants", wheel_to_variants),
+        ("deploy", deploy),
+        ("exists", exists),
+    ]
+
+    results = list()
+    for stage, func in stages:
+        result = measure(func, repeat)
+        result.update({
+            "case": case,
+            "stage": stage,
+            "files": files,
+            "purelib": purelib,
+            "entry_points": entry_points,
+        })
+        results.append(result)
+
+    return results
+
+
+def compare(results, baseline, tolerance=1.25, threshold=0.005):
+    """Compare `results` to `baseline`, both as returned by `run`
+
+    Stages faster than `threshold` seconds are too noisy
+    to compare, and are ignored.
+
+    Returns:
+        regressions (list): (case, stage, ratio) of stages slower
+            than `tolerance` times their baseline mean
+
+    """
+
+    previous = {
+        (result["case"], result["stage"]): result["mean"]
+        for result in baseline["results"]
+    }
+
+    regressions = list()
+    for result in results["results"]:
+        before = previous.get((result["case"], result["stage"]))
+
+        if not before or max(before, result["mean"]) < threshold:
+            continue
+
+        ratio = result["mean"] / before
+
+        if ratio > tolerance:
+            regressions.append((result["case"], result["stage"], ratio))
+
+    return regressions
+
+
+def _rmtree(path):
+    # Rez write-protects the package.py files
+    def del_rw(action, name, exc):
+        os.chmod(name, stat.S_IWRITE)
+        os.remove(name)
+
+    shutil.rmtree(path, onerror=del_rw)
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m pipz.benchmark",
+        description="Benchmark pipz offline, with synthetic wheels")
+    parser.add_argument(
+        "--sizes", default=",".join(str(s) for s in default_sizes),
+        help="Comma-separated number of files per wheel, "
+             "default is %(default)s")
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="Times each stage is measured, default is %(default)s")
+    parser.add_argument(
+        "--output", metavar="FILE",
+        help="Write results as JSON to FILE")
+    parser.add_argument(
+        "--compare", metavar="FILE",
+        help="Compare with results previously written with --output, "
+             "and exit with 1 on any stage being slower than --tolerance")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.25,
+        help="Ratio of slowdown relative --compare considered a "
+             "regression, default is %(default)s")
+
+    opts = parser.parse_args(argv[1:])
+
+    def log(msg):
+        sys.stdout.write(msg + "\n")
+        sys.stdout.flush()
+
+    results = run(
+        sizes=[int(size) for size in opts.sizes.split(",")],
+        repeat=opts.repeat,
+        log=log,
+    )
+
+    row = "  {:<32}{:<26}{:>10}{:>10}{:>10}"
+    log(row.format("case", "stage", "min", "mean", "max"))
+    for result in results["results"]:
+        log(row.format(
+            result["case"],
+            result["stage"],
+            "%.4f" % result["min"],
+            "%.4f" % result["mean"],
+            "%.4f" % result["max"],
+        ))
+
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+        log("Results written to %s" % opts.output)
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, opts.tolerance)
+
+        for case, stage, ratio in regressions:
+            log("REGRESSION %s %s %.2fx slower" % (case, stage, ratio))
+
+        if regressions:
+            return 1
+
+        log("No regressions compared to pipz-%s" % baseline["pipz"])
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""On-disk caches, shared between runs of pipz
+
+Staging directories produced by `pip install --target` are kept
+around, keyed by everything that may affect what pip ends up
+installing, such that re-running an identical request - on this
+or any other machine sharing the cache - skips pip altogether.
+
+Interpreters are probed once, and remembered until modified.
+
+"""
+
+import os
+import re
+import json
+import time
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+
+_log = logging.getLogger("pipz")
+
+
+def cache_root():
+    """Return root of on-disk caches, $PIPZ_CACHE or ~/.cache/pipz"""
+    return os.getenv("PIPZ_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "pipz"
+    )
+
+
+class ProbeCache(object):
+    """Results of probing interpreters, see `pipz.pip.probe`
+
+    Entries are keyed by path, modification time and size of the
+    interpreter, and are discarded once the pip they describe has
+    been modified, e.g. upgraded.
+
+    Only interpreters running as themselves are cached. Shims, such as
+    those of pyenv and asdf, run whichever interpreter their environment
+    points to, which the path of the shim says nothing about.
+
+    Arguments:
+        root (str): Absolute path to cache directory
+
+    """
+
+    def __init__(self, root):
+        self.root = os.path.join(root, "probe")
+
+    def get(self, executable):
+        fname = self._fname(executable)
+
+        if fname is None:
+            return None
+
+        try:
+            with open(fname) as f:
+                entry = json.load(f)
+
+        except (OSError, IOError, ValueError):
+            return None
+
+        if entry.get("pip_mtime") != _mtime(
+                entry["result"].get("pip_location")):
+            return None
+
+        if _shim(executable, entry["result"]):
+            return None
+
+        return entry["result"]
+
+    def put(self, executable, result):
+        fname = self._fname(executable)
+
+        if fname is None:
+            return
+
+        if _shim(executable, result):
+            _log.debug("Not caching probe of shim %s, running %s"
+                       % (executable, result.get("executable")))
+            return
+
+        entry = {
+            "pip_mtime": _mtime(result.get("pip_location")),
+            "result": result,
+        }
+
+        tmp = "%s.%d.%d.tmp" % (
+            fname, os.getpid(), threading.current_thread().ident
+        )
+
+        try:
+            if not os.path.exists(self.root):
+                os.makedirs(self.root)
+
+            with open(tmp, "w") as f:
+                json.dump(entry, f)
+
+            os.rename(tmp, fname)
+
+        except (OSError, IOError) as e:
+            # The cache is an optimisation, carry on without it
+            _log.debug("Could not cache probe of %s: %s" % (executable, e))
+
+    def _fname(self, executable):
+        try:
+            st = os.stat(executable)
+        except OSError:
+            return None
+
+        key = json.dumps([executable, st.st_mtime, st.st_size])
+        key = hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.root, key + ".json")
+
+
+def _digest(fname):
+    try:
+        with open(fname, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    except (OSError, IOError):
+        return fname
+
+
+def _shim(executable, result):
+    """Did `executable` run some other interpreter, as per its `result`?"""
+    return os.path.realpath(executable) != os.path.realpath(
+        result.get("executable") or "")
+
+
+def _mtime(fname):
+    try:
+        return os.path.getmtime(fname)
+    except (OSError, TypeError):
+        return None
+
+
+# Seconds after which staging left by e.g. a killed process is removed
+_tmp_max_age = 24 * 3600
+
+
+class StagingCache(object):
+    """Size-bounded, least-recently-used staging directories
+
+    Layout:
+        {root}/staging/{key}/       Result of pip install --target
+        {root}/staging/{key}.json   Size and request, mtime is last use
+        {root}/staging/{key}.*.tmp  Being staged, see `tempdir`
+
+    Arguments:
+        root (str): Absolute path to cache directory
+        max_size (int, optional): Bytes allowed in the cache before
+            least recently used entries are evicted
+
+    """
+
+    def __init__(self, root, max_size=2 * 1024 ** 3):
+        self.root = os.path.join(root, "staging")
+        self.max_size = max_size
+
+    def key(self, names, extra_args, python_version, pip_version, platform):
+        """Compute key of a request, normalised for superficial differences
+
+        E.g. ["Six == 1.12", "pyyaml"] and ["pyyaml", "six==1.12"]
+        result in the same key.
+
+        """
+
+        names = sorted(set(
+            re.sub(r"\s+", "", name).lower()
+            for name in names
+        ))
+
+        # Constraints files are identified by their content, rather
+        # than a path which may be temporary, see `download_all`
+        extra_args = list(extra_args or [])
+
+        for index, arg in enumerate(extra_args[:-1]):
+            if arg in ("-c", "--constraint"):
+                extra_args[index + 1] = _digest(extra_args[index + 1])
+
+        data = json.dumps([
+            names,
+            extra_args,
+            python_version,
+            pip_version,
+            platform,
+        ])
+
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return path to staging directory of `key`, if cached"""
+        path = os.path.join(self.root, key)
+        meta = path + ".json"
+
+        if not (os.path.isdir(path) and os.path.exists(meta)):
+            return None
+
+        try:
+            # Mark as recently used
+            os.utime(meta, None)
+        except OSError:
+            # Evicted by another process just now
+            return None
+
+        return path
+
+    def tempdir(self, key):
+        """Return a directory for pip to stage `key` into
+
+        It resides next to its final location, such
+        that it may be committed with a single rename.
+
+        """
+
+        path = os.path.join(self.root, "%s.%d.%d.tmp" % (
+            key, os.getpid(), threading.current_thread().ident
+        ))
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        os.makedirs(path)
+        return path
+
+    def put(self, key, tempdir, names=None):
+        """Commit staged `tempdir` under `key`
+
+        Returns:
+            path (str): Absolute path to cached staging directory
+
+        """
+
+        path = os.path.join(self.root, key)
+
+        size = sum(
+            os.path.getsize(os.path.join(dirpath, fname))
+            for dirpath, dirnames, fnames in os.walk(tempdir)
+            for fname in fnames
+        )
+
+        try:
+            os.rename(tempdir, path)
+
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY, errno.EACCES):
+                raise
+
+            # Another process got there first, use theirs
+            shutil.rmtree(tempdir)
+
+        else:
+            with open(path + ".json", "w") as f:
+                json.dump({
+                    "names": names or [],
+                    "size": size,
+                    "created": time.time(),
+                }, f)
+
+        self.evict(keep=key)
+        return path
+
+    def entries(self):
+        """Return (mtime, size, key) for each entry, oldest first"""
+        entries = list()
+
+        try:
+            fnames = os.listdir(self.root)
+        except OSError:
+            return entries
+
+        for fname in fnames:
+            if not fname.endswith(".json"):
+                continue
+
+            meta = os.path.join(self.root, fname)
+
+            try:
+                mtime = os.path.getmtime(meta)
+
+                with open(meta) as f:
+                    size = json.load(f)["size"]
+
+            except (OSError, IOError, ValueError, KeyError):
+                continue
+
+            entries.append((mtime, size, fname[:-len(".json")]))
+
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until below max size
+
+        Staging left over from downloads that never completed is
+        removed too, see `clean`.
+
+        Arguments:
+            keep (str, optional): Key to keep regardless, e.g. one
+                that has only just been added
+
+        """
+
+        self.clean()
+
+        entries = self.entries()
+        total = sum(size for mtime, size, key in entries)
+
+        for mtime, size, key in entries:
+            if total <= self.max_size:
+                break
+
+            if key == keep:
+                continue
+
+            self.remove(key)
+            total -= size
+
+    def clean(self, max_age=_tmp_max_age):
+        """Remove staging directories older than `max_age` seconds
+
+        Downloads in progress, by this or any other process or machine
+        sharing the cache, are younger and left alone.
+
+        Returns:
+            removed (list): Absolute paths to removed directories
+
+        """
+
+        removed = list()
+
+        try:
+            fnames = os.listdir(self.root)
+        except OSError:
+            return removed
+
+        for fname in fnames:
+            if not fname.endswith(".tmp"):
+                continue
+
+            path = os.path.join(self.root, fname)
+
+            try:
+                age = time.time() - os.path.getmtime(path)
+            except OSError:
+                # Committed or removed just now
+                continue
+
+            if age < max_age:
+                continue
+
+            _log.debug("Removing stale %s" % path)
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+
+        return removed
+
+    def remove(self, key):
+        path = os.path.join(self.root, key)
+        _log.debug("Evicting %s from cache" % path)
+
+        try:
+            os.remove(path + ".json")
+        except OSError:
+            pass
+
+        shutil.rmtree(path, ignore_errors=True)
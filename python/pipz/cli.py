@@ -7,9 +7,9 @@ import tempfile
 import argparse
 import contextlib
 
-from . import pip
+from . import pip, wheelhouse, tracing, server, manifest
+from .cache import StagingCache
 from .version import version
-from rez.config import config
 
 log = logging.getLogger("pipz")
 log.setLevel(logging.INFO)
@@ -43,19 +43,59 @@ def ask(msg):
         return False
 
 
+class Status(object):
+    """Live status of a stage, rewritten in place on a terminal"""
+
+    def __init__(self, live, max_width=40):
+        self._live = live
+        self._width = 0
+        self._max_width = max_width
+
+    def update(self, text):
+        if not self._live:
+            return
+
+        text = text[:self._max_width]
+        sys.stdout.write(text.ljust(self._width) + "\b" * max(
+            len(text), self._width))
+        sys.stdout.flush()
+        self._width = len(text)
+
+    def clear(self):
+        if self._width:
+            self.update("")
+
+
+def _format_size(size):
+    for unit, scale in (("GB", 10 ** 9), ("MB", 10 ** 6), ("kB", 10 ** 3)):
+        if size >= scale:
+            return "%.1f %s" % (float(size) / scale, unit)
+    return "%d B" % size
+
+
 @contextlib.contextmanager
 def stage(msg, timing=True):
     verbose = log.level < logging.INFO
     tell(msg, 1 if verbose else 0)
     t0 = time.time()
 
+    status = Status(live=(
+        not verbose and
+        log.level <= logging.INFO and
+        sys.stdout.isatty()
+    ))
+
     try:
-        yield
+        with tracing.span("stage", stage=msg.rstrip(". ")):
+            yield status
     except Exception:
+        status.clear()
         if not verbose:
             tell("fail")
         raise
     else:
+        status.clear()
+
         if verbose:
             return
 
@@ -65,7 +105,46 @@ def stage(msg, timing=True):
             tell("ok")
 
 
+def _progress(status):
+    """Return callback showing progress of pip in `status`"""
+
+    def progress(event):
+        if event["event"] in ("collecting", "cached"):
+            status.update(event["name"])
+
+        elif event["event"] == "downloading":
+            status.update("%s%s" % (event["name"], (
+                " (%s)" % _format_size(event["size"])
+                if event["size"] else ""
+            )))
+
+        elif event["event"] == "downloaded" and event["size"]:
+            status.update("%s (%s at %s/s)" % (
+                event["name"],
+                _format_size(event["size"]),
+                _format_size(event["rate"]),
+            ))
+
+        elif event["event"] == "installing":
+            status.update("Installing %d packages" % len(event["names"]))
+
+    return progress
+
+
+def _repository_index(opts, packagesdir):
+    from rez.config import config
+
+    paths = [packagesdir]
+
+    if opts.all_paths:
+        paths += config.packages_path
+
+    return pip.RepositoryIndex(paths)
+
+
 def _install(opts, extra_args, tempdir):
+    from rez.config import config
+
     python_version = pip.python_version()
     pip_version = pip.pip_version()
 
@@ -77,37 +156,124 @@ def _install(opts, extra_args, tempdir):
         error("pip could not be found")
         exit(1)
 
-    if pip_version < "19.0.0":
+    if pip.version_tuple(pip_version) < (19, 0):
         error("Requires pip>=19")
         exit(1)
 
-    tell("Using python-%s" % python_version)
+    # Packages are made for these, rather than the Python running pip
+    tell("Using python-%s" % ", ".join(opts.python or [python_version]))
     tell("Using pip-%s" % pip_version)
     tell("Using pipz-%s" % version)
 
     as_bundle = bool(opts.bundle and int(os.getenv("REZ_BUILD_ENV", "0")))
     rez_installing = bool(int(os.getenv("REZ_BUILD_INSTALL", "0")))
     packagesdir = ""
+    cache = None
+
+    if opts.cache:
+        cache = StagingCache(opts.cache, max_size=opts.cache_size * 10 ** 6)
+
+    # One index per repository, each read at most once
+    indexes = dict()
+
+    names = opts.install
+    planned = list()
+
+    if opts.resolve_first and not as_bundle:
+        packagesdir = opts.prefix or (
+            config.release_packages_path if opts.release
+            else config.local_packages_path
+        )
+
+        indexes[packagesdir] = _repository_index(opts, packagesdir)
+
+        try:
+            with stage("Resolving... ") as status:
+                resolutions = pip.resolve(
+                    opts.install,
+                    index=opts.wheelhouse or opts.index,
+                    extra_args=extra_args,
+                    on_progress=_progress(status),
+                )
+        except OSError as e:
+            tell(e)
+            exit(1)
+
+        missing, planned = pip.plan(resolutions,
+                                    indexes[packagesdir],
+                                    variants=opts.variant)
+
+        # Download only what's missing, exactly as resolved
+        names = [resolution.requirement for resolution in missing]
+        extra_args = extra_args + ["--no-deps"]
+
+    distributions = list()
+
+    # Requirements from a file are independent enough to resolve
+    # in groups, each constrained by every requirement of the file,
+    # whose overlapping dependencies are only kept once
+    groups = [names]
+    if opts.requirement and opts.jobs > 1:
+        groups = pip.split_requirements(names, opts.jobs)
 
     try:
-        with stage("Reading package lists... "):
-            distributions = pip.download(
-                opts.install,
-                tempdir=tempdir,
-                extra_args=extra_args,
-            )
+        if opts.python:
+            with stage("Reading package lists for python-%s... "
+                       % ", ".join(opts.python)):
+                distributions = pip.download_all(
+                    groups,
+                    tempdir=tempdir,
+                    jobs=max(opts.jobs, len(opts.python)),
+                    pythons=opts.python,
+                    index=opts.wheelhouse or opts.index,
+                    extra_args=extra_args,
+                    cache=cache,
+                    direct=opts.direct,
+                    platform=opts.platform,
+                )
+
+        elif len(groups) > 1:
+            with stage("Reading package lists in %d groups... "
+                       % len(groups)):
+                distributions = pip.download_all(
+                    groups,
+                    tempdir=tempdir,
+                    jobs=opts.jobs,
+                    index=opts.wheelhouse or opts.index,
+                    extra_args=extra_args,
+                    cache=cache,
+                    direct=opts.direct,
+                    platform=opts.platform,
+                )
+
+        elif names:
+            with stage("Reading package lists... ") as status:
+                distributions = pip.download(
+                    names,
+                    tempdir=tempdir,
+                    index=opts.wheelhouse or opts.index,
+                    extra_args=extra_args,
+                    cache=cache,
+                    on_progress=_progress(status),
+                    direct=opts.direct,
+                    platform=opts.platform,
+                )
     except OSError as e:
         tell(e)
         exit(1)
 
     with stage("Discovering existing packages... "):
-        new, exists = list(), list()
+        new, exists = list(), list(planned)
+        sizes = dict()
+        seen = set()
+
         for dist in distributions:
 
             try:
                 package = pip.convert(dist,
                                       variants=opts.variant,
-                                      dumb=opts.dumb)
+                                      dumb=opts.dumb,
+                                      zipped=opts.zip and not as_bundle)
             except Exception:
                 import traceback
                 traceback.print_exc()
@@ -116,6 +282,16 @@ def _install(opts, extra_args, tempdir):
                      "https://github.com/mottosso/rez-pipz/issues")
                 exit(1)
 
+            # Each distinct variant is only deployed once
+            key = (package.name, str(package.version), tuple(
+                str(req) for req in (package.variants or [[]])[0]))
+
+            if key in seen:
+                continue
+
+            seen.add(key)
+            sizes[package] = pip.distribution_size(dist)
+
             release_packages_path = (package.config.release_packages_path
                                      or config.release_packages_path)
             local_packages_path = (package.config.local_packages_path
@@ -124,7 +300,10 @@ def _install(opts, extra_args, tempdir):
                 release_packages_path if opts.release else local_packages_path
             )
 
-            if not as_bundle and pip.exists(package, packagesdir):
+            if packagesdir not in indexes:
+                indexes[packagesdir] = _repository_index(opts, packagesdir)
+
+            if not as_bundle and indexes[packagesdir].exists(package):
                 exists.append(package)
             else:
                 new.append(package)
@@ -144,17 +323,14 @@ def _install(opts, extra_args, tempdir):
 
         return tell("No new packages were installed")
 
-    size = sum(
-        os.path.getsize(os.path.join(dirpath, filename))
-        for dirpath, dirnames, filenames in os.walk(tempdir)
-        for filename in filenames
-    ) / (10.0 ** 6)  # mb
+    size = sum(sizes[package] for package in new) / (10.0 ** 6)  # mb
 
     # Determine column width for upcoming printing
     all_ = new + exists
     max_name = max((i.name for i in all_), key=len)
     max_version = max((str(i.version) for i in all_), key=len)
-    row_line = "  {:<%d}{:<%d}{}" % (len(max_name) + 4, len(max_version) + 2)
+    row_line = "  {:<%d}{:<%d}{:>10}  {}" % (
+        len(max_name) + 4, len(max_version) + 2)
 
     def format_variants(package):
         return (
@@ -162,11 +338,19 @@ def _install(opts, extra_args, tempdir):
             if package.variants else ""
         )
 
+    def format_size(package):
+        # Packages skipped by --resolve-first were never downloaded
+        if package not in sizes:
+            return ""
+
+        return "%.2f mb" % (sizes[package] / (10.0 ** 6))
+
     tell("The following NEW packages will be installed:")
     for package in new:
         tell(row_line.format(
             package.name,
             str(package.version),
+            format_size(package),
             format_variants(package)
         ))
 
@@ -176,6 +360,7 @@ def _install(opts, extra_args, tempdir):
             tell(row_line.format(
                 package.name,
                 str(package.version),
+                format_size(package),
                 format_variants(package)
             ))
 
@@ -187,6 +372,9 @@ def _install(opts, extra_args, tempdir):
             print("Cancelled")
             return
 
+    if opts.jobs > 1:
+        return _deploy_parallel(opts, new, exists, packagesdir, as_bundle)
+
     for index, package in enumerate(new):
         msg = "(%d/%d) Installing %s-%s... " % (
             index + 1, len(new),
@@ -199,8 +387,62 @@ def _install(opts, extra_args, tempdir):
                 package,
                 path=packagesdir,
                 as_bundle=as_bundle,
+                transfer=opts.transfer,
+                store=opts.store,
             )
 
+    if opts.compile and not as_bundle:
+        _compile(new, packagesdir)
+
+    tell("%d installed, %d skipped" % (len(new), len(exists)))
+
+
+def _compile(packages, packagesdir):
+    with stage("Compiling %d packages... " % len(packages)):
+        skipped = pip.compile_all(packages, path=packagesdir)
+
+    for package in skipped:
+        tell("%s-%s was not compiled" % (package.name, package.version))
+
+
+def _deploy_parallel(opts, new, exists, packagesdir, as_bundle):
+    # Packages finish in any order, so each line is
+    # printed in full once its package is done
+    finished = [0]
+
+    def on_deployed(package, exc):
+        finished[0] += 1
+        tell("(%d/%d) Installing %s-%s... %s" % (
+            finished[0], len(new),
+            package.name,
+            package.version,
+            "ok" if exc is None else "fail",
+        ))
+
+        if exc is not None:
+            error("%s-%s: %s" % (package.name, package.version, exc))
+
+    failed = pip.deploy_all(
+        new,
+        path=packagesdir,
+        jobs=opts.jobs,
+        callback=on_deployed,
+        as_bundle=as_bundle,
+        transfer=opts.transfer,
+        store=opts.store,
+    )
+
+    if opts.compile and not as_bundle:
+        failed_ = set(package for package, exc in failed)
+        _compile([package for package in new if package not in failed_],
+                 packagesdir)
+
+    if failed:
+        tell("%d installed, %d failed, %d skipped" % (
+            len(new) - len(failed), len(failed), len(exists)
+        ))
+        exit(1)
+
     tell("%d installed, %d skipped" % (len(new), len(exists)))
 
 
@@ -227,6 +469,425 @@ def _search(opts):
     popen.wait()
 
 
+def _wheelhouse(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m pipz.tools wheelhouse",
+        description="Manage a local directory of wheels")
+    parser.add_argument("command", choices=["build"], help=(
+        "build: Write a PEP 503 simple index for DIR, for use with "
+        "install --wheelhouse DIR"))
+    parser.add_argument("directory", metavar="DIR",
+                        help="Directory of .whl files")
+
+    opts = parser.parse_args(argv)
+
+    if not os.path.isdir(opts.directory):
+        error("%s is not a directory" % opts.directory)
+        return 1
+
+    with stage("Indexing %s... " % opts.directory):
+        projects = wheelhouse.build(opts.directory)
+
+    tell("%d wheels of %d projects indexed" % (
+        sum(len(fnames) for fnames in projects.values()), len(projects)
+    ))
+    tell("Install with --wheelhouse %s" % opts.directory)
+
+    return 0
+
+
+def _verify(argv, repair=False):
+    from rez.config import config
+
+    parser = argparse.ArgumentParser(
+        prog="python -m pipz.tools %s" % (
+            "repair" if repair else "verify"),
+        description=(
+            "Restore files of installed packages that are missing or "
+            "modified, downloading only what's damaged"
+            if repair else
+            "Compare files of installed packages with what was installed"
+        ))
+    parser.add_argument(
+        "request", nargs="*",
+        help="Packages, e.g. six or six-1.12.0, defaults to all of them")
+    parser.add_argument(
+        "-p", "--prefix", type=str, metavar="PATH",
+        help="Package repository, defaults to local packages")
+    parser.add_argument(
+        "--release", action="store_true",
+        help="Use the release package repository")
+
+    if repair:
+        parser.add_argument(
+            "--index", type=str, metavar="URL",
+            help="Download from this PEP 503 index rather than PyPI")
+        parser.add_argument(
+            "--wheelhouse", type=str, metavar="DIR",
+            help="Download from this local directory of wheels alone")
+
+    opts = parser.parse_args(argv)
+
+    packagesdir = os.path.abspath(opts.prefix or (
+        config.release_packages_path if opts.release
+        else config.local_packages_path
+    ))
+
+    roots = list()
+    for request in opts.request or [""]:
+        family, _, version = request.partition("-")
+        roots += manifest.find(packagesdir, family, version)
+
+    if not roots:
+        error("No packages installed by pipz found in %s" % packagesdir)
+        return 1
+
+    damaged_count, repaired_count = 0, 0
+
+    for root in roots:
+        name = "-".join(os.path.relpath(root, packagesdir).split(os.sep)[:2])
+
+        tell("Verifying %s... " % name, 0)
+        damaged = manifest.verify(root)
+        tell("%d files damaged" % len(damaged) if damaged else "ok")
+
+        for relpath, reason in damaged:
+            tell("  %s %s" % (reason, relpath))
+
+        if not damaged:
+            continue
+
+        damaged_count += 1
+
+        if not repair:
+            continue
+
+        try:
+            with stage("Repairing %s... " % name):
+                pip.repair(root,
+                           index=opts.wheelhouse or opts.index,
+                           damaged=damaged)
+
+        except OSError as e:
+            error(str(e))
+
+        else:
+            repaired_count += 1
+
+    if repair:
+        tell("%d verified, %d repaired, %d failed" % (
+            len(roots), repaired_count, damaged_count - repaired_count
+        ))
+        return 1 if damaged_count > repaired_count else 0
+
+    tell("%d verified, %d damaged" % (len(roots), damaged_count))
+    return 1 if damaged_count else 0
+
+
+def _convert_wheelhouse(argv):
+    import json
+    import multiprocessing
+    from rez.config import config
+
+    parser = argparse.ArgumentParser(
+        prog="python -m pipz.tools convert-wheelhouse",
+        description="Install every wheel of a directory, without pip")
+    parser.add_argument("directory", metavar="DIR",
+                        help="Directory of .whl files")
+    parser.add_argument(
+        "-p", "--prefix", type=str, metavar="PATH",
+        help="Install to this package repository, "
+             "defaults to local packages")
+    parser.add_argument(
+        "--release", action="store_true",
+        help="Install to the release package repository")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+        metavar="N",
+        help="Convert up to N packages at a time, each in a process of its "
+             "own, default is the number of cores, %(default)s")
+    parser.add_argument(
+        "--store", type=str, metavar="PATH",
+        default=os.getenv("PIPZ_STORE"),
+        help="Keep files in a content-addressed store at PATH, "
+             "see install --store")
+    parser.add_argument(
+        "--zip", action="store_true",
+        help="Deploy pure-Python packages as one python.zip each, "
+             "see install --zip")
+    parser.add_argument(
+        "--report", type=str, metavar="FILE",
+        help="Write the outcome of each wheel to FILE, as JSON")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="Print more information to the screen")
+
+    opts = parser.parse_args(argv)
+
+    if opts.verbose:
+        log.setLevel(logging.DEBUG)
+
+    if not os.path.isdir(opts.directory):
+        error("%s is not a directory" % opts.directory)
+        return 1
+
+    packagesdir = os.path.abspath(opts.prefix or (
+        config.release_packages_path if opts.release
+        else config.local_packages_path
+    ))
+
+    t0 = time.time()
+    counts = dict.fromkeys(("installed", "skipped", "unsupported", "failed"),
+                           0)
+
+    try:
+        with stage("Converting %s... " % opts.directory) as status:
+            def on_converted(result):
+                counts[result["status"]] += 1
+                status.update("%d converted" % sum(counts.values()))
+
+            results = pip.convert_wheelhouse(
+                os.path.abspath(opts.directory),
+                path=packagesdir,
+                jobs=opts.jobs,
+                callback=on_converted,
+                store=opts.store,
+                zipped=opts.zip,
+            )
+
+    except OSError as e:
+        error(str(e))
+        return 1
+
+    for result in results:
+        if result["status"] == "failed":
+            error("%s: %s" % (result["wheel"], result["error"]))
+
+    tell("%d installed, %d skipped, %d unsupported, %d failed" % (
+        counts["installed"],
+        counts["skipped"],
+        counts["unsupported"],
+        counts["failed"],
+    ))
+    tell("Packages were installed to %s" % packagesdir)
+
+    if opts.report:
+        with open(opts.report, "w") as f:
+            json.dump({
+                "directory": os.path.abspath(opts.directory),
+                "prefix": packagesdir,
+                "duration": time.time() - t0,
+                "summary": counts,
+                "results": sorted(results, key=lambda r: r["wheel"]),
+            }, f, indent=2, sort_keys=True)
+
+        tell("Report written to %s" % opts.report)
+
+    return 1 if counts["failed"] else 0
+
+
+def _serve(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m pipz.tools serve",
+        description="Install on behalf of `python -m pipz`, keeping Rez "
+                    "configuration, repository indexes and pip warm between "
+                    "installs. Non-interactive installs, e.g. with --yes, "
+                    "are forwarded here whilst serving.")
+    parser.add_argument(
+        "--socket", type=str, metavar="PATH", default=server.socket_path(),
+        help="Listen on this Unix domain socket, default is $PIPZ_SOCKET "
+             "or %(default)s")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=4, metavar="N",
+        help="Download for up to N requests concurrently, "
+             "queueing the remainder, default is %(default)s")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="Print more information to the screen")
+
+    opts = parser.parse_args(argv)
+
+    if opts.verbose:
+        log.setLevel(logging.DEBUG)
+
+    def on_ready(_):
+        tell("Serving on %s, Ctrl+C to stop" % opts.socket)
+
+    # Clean up the socket when stopped by e.g. a service manager, too
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        server.serve(opts.socket, jobs=opts.jobs, on_ready=on_ready)
+
+    except OSError as e:
+        error(str(e))
+        return 1
+
+    except KeyboardInterrupt:
+        tell("Stopped")
+
+    return 0
+
+
+def _forwardable(opts):
+    """Can `opts` be installed by `python -m pipz.tools serve`?
+
+    Only non-interactive installs are, as the server doesn't ask
+    before installing, and not with options it doesn't support, nor
+    to a server of another Python or Rez configuration.
+
+    """
+
+    if not (
+        (opts.yes or opts.quiet) and
+        not opts.no_server and
+        not opts.bundle and
+        not opts.dumb and
+        not opts.debug and
+        not opts.trace and
+        not opts.python and
+        not opts.platform and
+        not opts.resolve_first and
+        server.running()
+    ):
+        return False
+
+    try:
+        pong = server.request({"command": "ping"})
+    except (OSError, IOError):
+        return False
+
+    if pong.get("environment") != server.environment():
+        if opts.verbose:
+            tell("Not using pipz server @ %s, of another Python or "
+                 "Rez configuration" % server.socket_path())
+        return False
+
+    return True
+
+
+def _install_remote(opts, extra_args):
+    from rez.config import config
+
+    def abspath(path):
+        return os.path.abspath(path) if path else path
+
+    index = opts.wheelhouse or opts.index
+    if index and os.path.isdir(index):
+        index = abspath(index)
+
+    paths = list()
+    if opts.all_paths:
+        paths = config.packages_path
+
+    packagesdir = opts.prefix or (
+        config.release_packages_path if opts.release
+        else config.local_packages_path
+    )
+
+    message = {
+        "command": "install",
+        "environment": server.environment(),
+        "names": opts.install,
+        "prefix": abspath(packagesdir),
+        "variants": opts.variant,
+        "index": index,
+        "extra_args": extra_args,
+        "paths": paths,
+        "jobs": opts.jobs,
+        "transfer": opts.transfer,
+        "store": abspath(opts.store),
+        "cache": abspath(opts.cache),
+        "cache_size": opts.cache_size,
+        "direct": opts.direct,
+        "compile": opts.compile,
+        "zip": opts.zip,
+        "shim": opts.shim,
+    }
+
+    tell("Using pipz server @ %s" % server.socket_path())
+
+    state = {"new": 0, "finished": 0}
+
+    def on_event(event):
+        if event["event"] == "planned":
+            state["new"] = len(event["new"])
+
+            for name, version_ in event["waiting"]:
+                tell("Waiting for %s-%s, installed by another request" % (
+                    name, version_))
+
+        elif event["event"] == "deployed":
+            state["finished"] += 1
+            tell("(%d/%d) Installing %s-%s... %s" % (
+                state["finished"], state["new"],
+                event["name"],
+                event["version"],
+                "ok" if event["error"] is None else "fail",
+            ))
+
+            if event["error"] is not None:
+                error("%s-%s: %s" % (
+                    event["name"], event["version"], event["error"]))
+
+    try:
+        result = server.request(message, on_event=on_event)
+    except OSError as e:
+        error(str(e))
+        return 1
+
+    if not result["installed"] and not result["failed"]:
+        tell("No new packages were installed")
+
+    if result["failed"]:
+        tell("%d installed, %d failed, %d skipped" % (
+            len(result["installed"]),
+            len(result["failed"]),
+            len(result["skipped"]),
+        ))
+        return 1
+
+    tell("%d installed, %d skipped" % (
+        len(result["installed"]), len(result["skipped"])
+    ))
+
+    return 0
+
+
+# Commands other than install, e.g. `python -m pipz.tools wheelhouse build`
+_commands = {
+    "wheelhouse": _wheelhouse,
+    "serve": _serve,
+    "verify": _verify,
+    "repair": lambda argv: _verify(argv, repair=True),
+    "convert-wheelhouse": _convert_wheelhouse,
+}
+
+
+def tools(argv=sys.argv):
+    """Run one of `_commands`, see `pipz.tools`
+
+    Kept apart from `main`, whose every argument is a package to
+    install, e.g. one called "serve".
+
+    """
+
+    logging.basicConfig(format="%(levelname)s %(message)s")
+    logging.getLogger("rez.vendor.distlib").setLevel(logging.CRITICAL)
+
+    parser = argparse.ArgumentParser(
+        prog="python -m pipz.tools",
+        description="Commands of pipz other than installing packages")
+    parser.add_argument("command", choices=sorted(_commands))
+    parser.add_argument("args", nargs=argparse.REMAINDER,
+                        help="Arguments of command, see COMMAND --help")
+
+    opts = parser.parse_args(argv[1:])
+
+    return _commands[opts.command](opts.args)
+
+
 def main(argv=sys.argv):
     # Mute unnecessary messages
     logging.basicConfig(format="%(levelname)s %(message)s")
@@ -234,8 +895,13 @@ def main(argv=sys.argv):
 
     parser = argparse.ArgumentParser(description="pip for Rez")
     parser.add_argument(
-        "install", nargs="+",
+        "install", nargs="*",
         help="Install the package")
+    parser.add_argument(
+        "-r", "--requirement", action="append", metavar="FILE",
+        help="Install from the given requirements file, may be called "
+             "multiple times. With --jobs, requirements are split into "
+             "groups, resolved and downloaded concurrently")
     parser.add_argument(
         "-b", "--bundle", action="store_true",
         help="If enabled, and environment variable $REZ_BUILD_ENV is set, "
@@ -259,6 +925,18 @@ def main(argv=sys.argv):
              "enabled and environment variable $REZ_BUILD_ENV is set, "
              "the --prefix will become the suffix of current Rez package "
              "build/install path.")
+    parser.add_argument(
+        "--index", type=str, metavar="URL",
+        help="Install from this PEP 503 index rather than PyPI")
+    parser.add_argument(
+        "--wheelhouse", type=str, metavar="DIR",
+        help="Install from this local directory of wheels alone, "
+             "using its index if up to date with "
+             "`python -m pipz.tools wheelhouse build`")
+    parser.add_argument(
+        "--all-paths", action="store_true",
+        help="Skip packages already present in any repository on "
+             "$REZ_PACKAGES_PATH, not only the one installed to")
     parser.add_argument(
         "-y", "--yes", action="store_true",
         help="Pre-emptively answer the question to continue")
@@ -271,6 +949,77 @@ def main(argv=sys.argv):
     parser.add_argument(
         "--debug", action="store_true",
         help="Do not clean up temporary files")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, metavar="N",
+        help="Deploy up to N packages concurrently")
+    parser.add_argument(
+        "--transfer", default="copy", choices=["copy",
+                                               "hardlink",
+                                               "reflink",
+                                               "move",
+                                               "copy_file_range"],
+        help="How files are brought over from the temporary directory. "
+             "Modes unsupported by the filesystem fall back to copy.")
+    parser.add_argument(
+        "--store", type=str, metavar="PATH",
+        default=os.getenv("PIPZ_STORE"),
+        help="Keep files in a content-addressed store at PATH, shared "
+             "amongst packages and linked into each package. Should reside "
+             "on the same filesystem as the package repository. "
+             "Defaults to $PIPZ_STORE")
+    parser.add_argument(
+        "--cache", type=str, metavar="PATH",
+        default=os.getenv("PIPZ_CACHE"),
+        help="Keep packages staged by pip at PATH, and reuse them when "
+             "making the same request again with the same Python, pip and "
+             "platform. Defaults to $PIPZ_CACHE")
+    parser.add_argument(
+        "--cache-size", type=int, default=2048, metavar="MB",
+        help="Remove least recently used packages from --cache once "
+             "larger than this, default is 2048 mb")
+    parser.add_argument(
+        "--python", type=lambda value: value.split(","),
+        metavar="VERSIONS",
+        help="Install for each of these comma-separated versions of Python, "
+             "e.g. 2.7,3.7,3.9, rather than the one in use. Each version is "
+             "downloaded concurrently, considering wheels alone, and "
+             "pure-Python packages are shared between versions")
+    parser.add_argument(
+        "--platform", type=str, metavar="PLATFORM",
+        help="Install wheels for this platform, e.g. manylinux2014_x86_64, "
+             "rather than the one in use. Packages are still made variants "
+             "of the os in use")
+    parser.add_argument(
+        "--resolve-first", action="store_true",
+        help="Ask pip what it would install before downloading anything, "
+             "and only download what is missing from the repository. "
+             "Requires pip>=22.2")
+    parser.add_argument(
+        "--direct", action="store_true",
+        help="Have pip only download wheels, and extract them directly "
+             "into each package, rather than installing into a temporary "
+             "directory first. Halves what is written to disk.")
+    parser.add_argument(
+        "--compile", action="store_true",
+        help="Byte-compile packages once installed, across all cores and "
+             "with the version of Python of each package. Ignored with "
+             "--bundle")
+    parser.add_argument(
+        "--zip", action="store_true",
+        help="Deploy pure-Python packages as one python.zip each, for "
+             "fewer files to look through on import. Packages with native "
+             "extensions, resources or use of __file__ remain directories. "
+             "Zipped packages aren't byte-compiled. Ignored with --bundle")
+    parser.add_argument(
+        "--no-server", action="store_true",
+        help="Install from this process, even whilst serving installs")
+    parser.add_argument(
+        "--trace", type=str, metavar="FILE",
+        help="Write how long each stage, pip and each package took to FILE")
+    parser.add_argument(
+        "--trace-format", default="jsonl", choices=["jsonl", "chrome"],
+        help="Write --trace as JSON lines, or Chrome trace events for "
+             "chrome://tracing, default is jsonl")
     parser.add_argument(
         "--shim", default="binary", choices=["binary", "bat"],
         help="Windows-only, whether to generate binary or bat console_scripts")
@@ -285,6 +1034,25 @@ def main(argv=sys.argv):
 
     opts, extra_args = parser.parse_known_args(argv[1:])
 
+    for fname in opts.requirement or []:
+        try:
+            names, options = pip.read_requirements(fname)
+        except (OSError, IOError) as e:
+            error("Could not read %s: %s" % (fname, e))
+            return 1
+
+        opts.install += names
+        extra_args += options
+
+    if opts.resolve_first and (opts.python or opts.platform):
+        error("--resolve-first resolves for the Python in use, "
+              "and cannot be combined with --python or --platform")
+        return 1
+
+    if opts.requirement and not opts.install:
+        error("No requirements found in %s" % ", ".join(opts.requirement))
+        return 1
+
     if opts.verbose:
         log.setLevel(logging.DEBUG)
 
@@ -297,8 +1065,19 @@ def main(argv=sys.argv):
     if opts.debug:
         tell("Debug mode enabled, preserving temporary files")
 
+    if opts.trace:
+        tracing.start(opts.trace, opts.trace_format)
+
     success = True
 
+    if opts.install and _forwardable(opts):
+        t0 = time.time()
+        returncode = _install_remote(opts, extra_args)
+        tell("Completed in %.2fs" % (time.time() - t0)
+             if returncode == 0 else "Failed")
+
+        return returncode
+
     if opts.install:
         t0 = time.time()
         tmpdir = tempfile.mkdtemp()
@@ -315,6 +1094,8 @@ def main(argv=sys.argv):
             else:
                 shutil.rmtree(tmpdir)
 
+            tracing.stop()
+
         tell(
             ("Completed in %.2fs" % (time.time() - t0))
             if success else "Failed"
@@ -0,0 +1,175 @@
+"""What was deployed, such that damage may later be found and repaired
+
+Each package carries a manifest of its files alongside its package
+definition, written once deployed.
+
+Layout:
+    {root}/.pipz-manifest.json
+    {
+        "requirement": "six==1.12.0",
+        "files": [
+            ["python/six.py", "<sha256>", 32452, 1570000000.123, "six.py"],
+            ...
+        ],
+        ...
+    }
+
+Each file is (relpath, sha256, size, mtime, source), where `source` is
+the path of the file within the distribution, or None for files written
+by pipz itself, such as console scripts.
+
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+_log = logging.getLogger("pipz")
+
+# Relative the root of a package
+fname = ".pipz-manifest.json"
+
+
+def write(root, files, **info):
+    """Write manifest of `files` of package at `root`
+
+    Arguments:
+        root (str): Absolute path to root of package
+        files (list): Of (relpath, sha256, size, source), where sha256
+            may be None for files to be hashed
+        **info: Additional information, such as how to download the
+            package again, see `pipz.pip.repair`
+
+    """
+
+    entries = list()
+
+    for relpath, digest, size, source in files:
+        abspath = os.path.join(root, relpath)
+        st = os.stat(abspath)
+
+        # Known digests are only good for the size they were given for
+        if digest is None or size != st.st_size:
+            digest, size = hash_file(abspath)
+
+        entries.append([relpath, digest, size, st.st_mtime, source])
+
+    manifest = dict(info)
+    manifest["files"] = sorted(entries)
+
+    with open(os.path.join(root, fname), "w") as f:
+        json.dump(manifest, f, sort_keys=True)
+
+
+def read(root):
+    """Return manifest of package at `root`, or None if it has none"""
+    try:
+        with open(os.path.join(root, fname)) as f:
+            return json.load(f)
+
+    except (OSError, IOError):
+        return None
+
+
+def touch(root, relpaths):
+    """Remember current modification time of `relpaths`, once repaired"""
+    manifest = read(root)
+    relpaths = set(relpaths)
+
+    for entry in manifest["files"]:
+        if entry[0] in relpaths:
+            entry[3] = os.stat(os.path.join(root, entry[0])).st_mtime
+
+    with open(os.path.join(root, fname), "w") as f:
+        json.dump(manifest, f, sort_keys=True)
+
+
+def verify(root, manifest=None):
+    """Compare files of package at `root` with its manifest
+
+    Files of the same size and modification time as when deployed
+    are considered intact, and only the remainder are hashed.
+
+    Arguments:
+        root (str): Absolute path to root of package
+        manifest (dict, optional): As returned by `read`
+
+    Returns:
+        damaged (list): Of (relpath, reason), where reason is
+            either "missing" or "modified"
+
+    Raises:
+        OSError: On `root` having no manifest
+
+    """
+
+    manifest = manifest or read(root)
+
+    if manifest is None:
+        raise OSError("%s has no manifest" % root)
+
+    damaged = list()
+
+    for relpath, digest, size, mtime, source in manifest["files"]:
+        abspath = os.path.join(root, relpath)
+
+        try:
+            st = os.stat(abspath)
+        except OSError:
+            damaged.append((relpath, "missing"))
+            continue
+
+        if st.st_size != size:
+            damaged.append((relpath, "modified"))
+
+        elif st.st_mtime != mtime and hash_file(abspath)[0] != digest:
+            damaged.append((relpath, "modified"))
+
+    return damaged
+
+
+def find(path, family=None, version=None):
+    """Yield root of every package with a manifest in repository `path`
+
+    Arguments:
+        path (str): Absolute path to filesystem package repository
+        family (str, optional): Only packages of this family
+        version (str, optional): Only this version of `family`
+
+    """
+
+    top = path
+    if family:
+        top = os.path.join(top, family)
+
+        if version:
+            top = os.path.join(top, version)
+
+    for base, dirs, files in os.walk(top):
+        if fname in files:
+            yield base
+
+            # Variants don't nest
+            dirs[:] = []
+            continue
+
+        # Staging and the like, see `pipz.pip._staging_dirname`,
+        # along with the content of packages deployed without one
+        dirs[:] = sorted(
+            d for d in dirs
+            if not d.startswith(".") and d not in ("python", "bin")
+        )
+
+
+def hash_file(fname, chunk_size=2 ** 20):
+    """Return sha256 hex digest and size of `fname`"""
+    sha = hashlib.sha256()
+    size = 0
+
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+            size += len(chunk)
+
+    return sha.hexdigest(), size
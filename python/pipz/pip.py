@@ -6,35 +6,82 @@ Algorithm:
     3. Convert pip-package requirements to rez-requirements
     4. Convert pip-package to rez-package
 
-"""
+Alternatively, with `direct=True`, pip only resolves and downloads
+wheels, which are then extracted straight into each Rez package.
+
+With `resolve_first=True`, pip is first asked what it would install,
+and only what isn't already in the Rez repository is downloaded.
 
-from rez.utils.logging_ import print_warning
-from rez.package_maker__ import PackageMaker
-from rez.developer_package import DeveloperPackage
-from rez.config import config
-from rez.vendor.six import six
-from rez.utils.platform_ import platform_
-from rez.utils.filesystem import retain_cwd
-from rez.backport.lru_cache import lru_cache
+"""
 
-from pkg_resources import find_distributions
+# Rez and pkg_resources are imported where used, as they're
+# expensive to import and aren't needed to e.g. print --help
 
 import os
 import re
 import sys
+import csv
+import json
+import time
 import stat
+import shlex
 import errno
+import base64
 import shutil
+import hashlib
+import binascii
 import logging
+import itertools
 import tempfile
+import functools
+import threading
 import traceback
+import zipfile
 import subprocess
+import collections
+
+from . import tracing, manifest, wheelhouse
+from .cache import ProbeCache, cache_root
 
 try:
     from configparser import ConfigParser
 except ImportError:
     from ConfigParser import ConfigParser
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from functools import lru_cache
+except ImportError:
+    # Python 2, whose rez.backport would import rez.config along with it
+    def lru_cache(maxsize=None):
+        """Remember results per arguments, without bounds"""
+
+        def decorator(func):
+            results = dict()
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (args, tuple(sorted(kwargs.items())))
+
+                if key not in results:
+                    results[key] = func(*args, **kwargs)
+
+                return results[key]
+
+            wrapper.cache_clear = results.clear
+            return wrapper
+
+        return decorator
+
+try:
+    _basestring = basestring
+except NameError:
+    _basestring = str
+
 
 # As per https://packaging.python.org/
 #        specifications/entry-points/#file-format
@@ -42,16 +89,28 @@ class CaseSensitiveConfigParser(ConfigParser):
     optionxform = staticmethod(str)
 
 
+class IntegrityError(OSError):
+    """A file did not match the hash or size given by its RECORD"""
+
+
 # Public API
 __all__ = [
     "install",
     "download",
     "convert",
     "deploy",
+    "deploy_all",
+    "exists",
+    "exists_all",
+    "resolve",
+    "plan",
+    "download_all",
+    "compile_all",
+    "read_requirements",
+    "repair",
+    "convert_wheelhouse",
 ]
 
-_basestring = six.string_types[0]
-_package_to_distribution = {}
 _log = logging.getLogger("pipz")
 _pipzdir = os.path.dirname(__file__)
 _pythondir = os.path.dirname(_pipzdir)
@@ -59,12 +118,27 @@ _rootdir = os.path.dirname(_pythondir)
 _shim = os.path.join(_rootdir, "bin", "shim.exe")
 _log = logging.getLogger("pipz")
 
+# Rez isn't safe to read nor write packages from multiple threads,
+# e.g. deploying concurrently or serving requests, see `pipz.server`
+_rez_lock = threading.RLock()
+
 
 def install(names,
             prefix=None,
             release=False,
             variants=None,
-            extra_args=None):
+            index=None,
+            extra_args=None,
+            jobs=1,
+            transfer="copy",
+            store=None,
+            cache=None,
+            paths=None,
+            on_progress=None,
+            direct=False,
+            resolve_first=False,
+            compile=False,
+            zipped=False):
     """Convenience function to below functions
 
     Arguments:
@@ -74,300 +148,2584 @@ def install(names,
         variants (list, optional): Override variants detected by WHEEL
         index (str, optional): Override PyPI index. This should point to a
             repository compliant with PEP 503 (the simple repository API)
-            or a local directory laid out in the same format.
+            or a local directory laid out in the same format, or simply
+            containing wheels, see `pipz.wheelhouse`
         extra_args (list, optional): Additional arguments passed to `pip`
+        jobs (int, optional): Number of packages to deploy concurrently
+        transfer (str, optional): How files are deployed, see `transfer_file`
+        store (str, optional): Path to a content-addressed store shared
+            between packages, see `store_file`
+        cache (pipz.cache.StagingCache, optional): Reuse packages
+            previously staged by pip, see `download`
+        paths (list, optional): Additional repositories in which packages
+            are considered to already exist, e.g. config.packages_path
+        on_progress (callable, optional): Called with progress of pip,
+            see `call`
+        direct (bool, optional): Extract downloaded wheels directly into
+            each package, rather than going through `pip install`
+        resolve_first (bool, optional): Only download packages missing
+            from the repository, see `resolve`. Requires pip>=22.2
+        compile (bool, optional): Byte-compile packages once deployed,
+            see `compile_all`
+        zipped (bool, optional): Deploy pure-Python packages as one
+            python.zip each, see `zippable`
+
+    Raises:
+        OSError: On any package failing to deploy, after the
+            remaining packages have been deployed
+
+    """
+
+    from rez.config import config
+
+    assert prefix is None or isinstance(prefix, _basestring), (
+        "%s was not str" % prefix)
+    assert isinstance(names, (tuple, list)), "%s was not list or tuple" % names
+
+    packagesdir = prefix or (
+        config.release_packages_path if release
+        else config.local_packages_path
+    )
+
+    if resolve_first:
+        missing, _ = plan(
+            resolve(names,
+                    index=index,
+                    extra_args=extra_args,
+                    on_progress=on_progress),
+            RepositoryIndex([packagesdir] + list(paths or [])),
+            variants=variants,
+        )
+
+        if not missing:
+            return []
+
+        # What's missing has been resolved already
+        names = [resolution.requirement for resolution in missing]
+        extra_args = list(extra_args or []) + ["--no-deps"]
+
+    tempdir = tempfile.mkdtemp(suffix="-rez", prefix="pip-")
+
+    try:
+        distributions = download(
+            names,
+            tempdir=tempdir,
+            index=index,
+            extra_args=extra_args,
+            cache=cache,
+            on_progress=on_progress,
+            direct=direct,
+        )
+
+        return _install_distributions(distributions,
+                                      packagesdir=packagesdir,
+                                      variants=variants,
+                                      paths=paths,
+                                      jobs=jobs,
+                                      transfer=transfer,
+                                      store=store,
+                                      compile=compile,
+                                      zipped=zipped)
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def _install_distributions(distributions,
+                           packagesdir,
+                           variants=None,
+                           paths=None,
+                           jobs=1,
+                           transfer="copy",
+                           store=None,
+                           compile=False,
+                           zipped=False):
+    """Convert and deploy what `install` downloaded, returning what's new"""
+    packages = [
+        convert(dist, variants=variants, zipped=zipped)
+        for dist in distributions
+    ]
+
+    new, existing = list(), list()
+    for package, exists_ in zip(packages, exists_all(
+            packages, [packagesdir] + list(paths or []))):
+
+        if exists_:
+            existing.append(package)
+        else:
+            new.append(package)
+
+    if not new:
+        return []
+
+    failed = deploy_all(new,
+                        path=packagesdir,
+                        jobs=jobs,
+                        transfer=transfer,
+                        store=store)
+
+    if compile:
+        failed_ = set(package for package, error in failed)
+        compile_all([package for package in new if package not in failed_],
+                    path=packagesdir)
+
+    if failed:
+        raise OSError("Failed to deploy %s" % ", ".join(
+            "%s-%s (%s)" % (package.name, package.version, error)
+            for package, error in failed
+        ))
+
+    return new
+
+
+def download(names,
+             tempdir=None,
+             index=None,
+             extra_args=None,
+             cache=None,
+             on_progress=None,
+             direct=False,
+             python=None,
+             platform=None):
+    """Gather pip packages in `tempdir`
+
+    Arguments:
+        names (list): Names of packages to install, in pip-format,
+            e.g. ["six==1"]
+        tempdir (str, optional): Absolute path to where pip packages go until
+            they've been installed as Rez packages, defaults to the cwd
+        index (str, optional): URL of PEP 503 index, or path to local
+            directory of wheels, with or without a PEP 503 index
+        extra_args (list, optional): Additional arguments, typically only
+            relevant to pip rather than pipz
+        cache (pipz.cache.StagingCache, optional): Reuse and keep staged
+            packages in this cache, in place of `tempdir`
+        on_progress (callable, optional): Called with progress of pip,
+            see `call`
+        direct (bool, optional): Only download wheels, building any source
+            distribution into a wheel, without installing them. Their
+            content is extracted on `deploy`, halving what's written to disk
+        python (str, optional): Download for this version of Python, e.g.
+            "2.7", rather than the one in use. Only wheels are considered,
+            and are always downloaded as per `direct`.
+        platform (str, optional): Download for this platform, e.g.
+            "manylinux2014_x86_64", rather than the one in use, as per
+            `python`. Variants are still those of this os.
+
+    Returns:
+        distributions (list): Downloaded distlib.database.InstalledDistribution,
+            or wheels on `direct`, see `WheelMetadata`
+
+    Raises:
+        OSError: On anything gone wrong with subprocess and pip
+
+    """
+
+    job = _Download(names,
+                    tempdir=tempdir,
+                    index=index,
+                    extra_args=extra_args,
+                    cache=cache,
+                    direct=direct,
+                    python=python,
+                    platform=platform)
+
+    if job.distributions is None:
+        try:
+            call(job.command, on_progress=on_progress)
+
+        except Exception:
+            job.discard()
+            raise
+
+        job.complete()
+
+    return job.distributions
+
+
+class _Download(object):
+    """What `download` does before and after calling pip
+
+    Distributions are available straight away when cached, otherwise
+    once `command` has been called.
+
+    """
+
+    def __init__(self,
+                 names,
+                 tempdir=None,
+                 index=None,
+                 extra_args=None,
+                 cache=None,
+                 direct=False,
+                 python=None,
+                 platform=None):
+
+        extra_args = (
+            list(extra_args or []) +
+            _index_args(index) +
+            _target_args(python, platform)
+        )
+
+        # `pip install` checks Requires-Python against the Python in
+        # use, even with --python-version, whereas `pip download` doesn't
+        direct = direct or bool(python or platform)
+
+        assert isinstance(names, (list, tuple)), (
+            "%s was not a tuple or list" % names
+        )
+        assert all(isinstance(name, _basestring) for name in names), (
+            "%s contained non-string" % names
+        )
+
+        self.names = names
+        self.cache = cache
+        self.direct = direct
+        self.python = python
+        self.tempdir = tempdir or os.getcwd()
+        self.distributions = None
+        self.command = None
+
+        if cache is not None:
+            self.key = cache.key(names,
+                                 extra_args + (["--direct"] if direct else []),
+                                 python_version(),
+                                 pip_version(),
+                                 [platform_name(), os_name()])
+
+            cached = cache.get(self.key)
+
+            if cached:
+                _log.debug("Using cached %s" % cached)
+                self.distributions = _find_distributions(cached,
+                                                         cached=True,
+                                                         direct=direct,
+                                                         python=python)
+                return
+
+            self.tempdir = cache.tempdir(self.key)
+
+        # Build pip commandline
+        cmd = ["python", "-m", "pip"]
+
+        if direct and (python or platform):
+            # Wheels are never built for another Python or platform
+            cmd += ["download", "--dest", self.tempdir]
+
+        elif direct:
+            cmd += ["wheel", "--wheel-dir", self.tempdir]
+
+        else:
+            cmd += [
+                "install",
+                "--target", self.tempdir,
+
+                # Handle case where the Python distribution used alongside
+                # pip already has a package installed in its `site-packages/`
+                "--ignore-installed",
+
+                # Bytecode is never deployed, see `compile_all`
+                "--no-compile",
+            ]
+
+        cmd += [
+            # Only ever consider wheels, anything else is ancient
+            "--use-pep517",
+
+            # rez pip users don't have to see this
+            "--disable-pip-version-check",
+        ]
+
+        from rez.utils.logging_ import print_warning
+
+        for extra_arg in extra_args:
+            if extra_arg in cmd:
+                print_warning("'%s' argument ignored, used internally"
+                              % extra_arg)
+                continue
+            cmd += [extra_arg]
+
+        self.command = cmd + list(names)
+
+    def discard(self):
+        """Forget what pip left behind, after it failed"""
+        if self.cache is not None:
+            shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def complete(self):
+        """Find what pip downloaded, after it succeeded"""
+        tempdir = self.tempdir
+
+        if self.cache is not None:
+            tempdir = self.cache.put(self.key, tempdir, names=self.names)
+
+        self.distributions = _find_distributions(
+            tempdir,
+            cached=self.cache is not None,
+            direct=self.direct,
+            python=self.python
+        )
+
+
+def download_all(groups, tempdir, jobs=1, pythons=None, **kwargs):
+    """Download each group of requirements independently, `jobs` at a time
+
+    Each group is resolved by pip on its own, such that groups
+    may share dependencies, which are only returned once. Every
+    requirement of every group constrains each group, such that
+    a pin in one applies to the dependencies of another.
+
+    Arguments:
+        groups (list): Lists of names of packages, in pip-format
+        tempdir (str): Absolute path to where groups are downloaded,
+            each into a directory of its own
+        jobs (int, optional): Number of groups to download concurrently
+        pythons (list, optional): Download every group for each of these
+            versions of Python, e.g. ["2.7", "3.7"], see `download`
+        **kwargs: Additional arguments passed to `download`
+
+    Returns:
+        distributions (list): Of every group, each distinct name,
+            version and variant only once. Pure-Python distributions
+            are thereby shared across versions of Python.
+
+    Raises:
+        OSError: On any group failing, once every group has finished,
+            or on groups resolving different versions of a package
+
+    """
+
+    if len(groups) > 1:
+        constraints = os.path.join(tempdir, "constraints.txt")
+        _makedirs(tempdir)
+
+        with open(constraints, "w") as f:
+            f.write("".join(
+                "%s\n" % constraint
+                for group in groups
+                for constraint in map(_constraint, group)
+                if constraint
+            ))
+
+        kwargs["extra_args"] = list(kwargs.get("extra_args") or []) + [
+            "-c", constraints]
+
+    tasks = [
+        (group, python)
+        for python in pythons or [None]
+        for group in groups
+    ]
+
+    def _download_one(index):
+        group, python = tasks[index]
+
+        try:
+            return download(group,
+                            tempdir=os.path.join(tempdir, "group%d" % index),
+                            python=python,
+                            **kwargs), None
+
+        except Exception as e:
+            return [], e
+
+    jobs = max(1, min(jobs or 1, len(tasks)))
+
+    if jobs == 1:
+        results = [_download_one(index) for index in range(len(tasks))]
+    else:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(jobs)
+
+        try:
+            results = pool.map(_download_one, range(len(tasks)))
+        finally:
+            pool.close()
+            pool.join()
+
+    errors = [str(error) for _, error in results if error is not None]
+
+    if errors:
+        raise OSError("\n".join(errors))
+
+    # Dependencies pinned by no requirement may still differ across groups
+    versions = dict()
+
+    for (group, _), (_, python) in zip(results, tasks):
+        for dist in group:
+            versions.setdefault((python, dist.project_name), set()).add(
+                dist.version)
+
+    conflicts = sorted(
+        "%s (%s)" % (name, ", ".join(sorted(found)))
+        for (python, name), found in versions.items()
+        if len(found) > 1
+    )
+
+    if conflicts:
+        raise OSError("Groups resolved different versions of %s, "
+                      "pin these or use fewer groups" % ", ".join(conflicts))
+
+    distributions, seen = list(), set()
+
+    for group, _ in results:
+        for dist in group:
+            key = (dist.key, dist.version, tuple(
+                _variants_from_distribution(dist)))
+
+            if key in seen:
+                continue
+
+            seen.add(key)
+            distributions.append(dist)
+
+    return sorted(distributions, key=lambda d: d.key)
+
+
+def read_requirements(fname):
+    """Read requirements file `fname`, as understood by pip
+
+    Nested requirements files, e.g. -r base.txt, are read in turn,
+    relative `fname`. Options, e.g. --index-url or -c constraints.txt,
+    are returned for passing on to pip.
+
+    https://pip.pypa.io/en/stable/reference/requirements-file-format/
+
+    Returns:
+        names, options (tuple): Lists of requirements and options
+
+    """
+
+    dirname = os.path.dirname(os.path.abspath(fname))
+    names, options = list(), list()
+
+    with open(fname) as f:
+        # Lines ending with a backslash continue onto the next
+        content = re.sub(r"\\\r?\n", " ", f.read())
+
+    for line in content.splitlines():
+        line = re.sub(r"(^|\s)#.*$", "", line).strip()
+
+        if not line:
+            continue
+
+        if not line.startswith("-"):
+            # Per-requirement options, e.g. --hash, only apply to files
+            names.append(" ".join(re.split(r"\s+--", line)[0].split()))
+            continue
+
+        # E.g. --requirement=base.txt or -rbase.txt
+        match = re.match(r"(-\w|--[\w-]+)(?:=|\s+)?(.*)$", line)
+        option, value = match.groups()
+
+        if option in ("-r", "--requirement"):
+            nested, nested_options = read_requirements(
+                os.path.join(dirname, value))
+            names.extend(nested)
+            options.extend(nested_options)
+
+        elif option in ("-c", "--constraint"):
+            options.extend([option, os.path.join(dirname, value)])
+
+        elif option in ("-f", "--find-links") and os.path.exists(
+                os.path.join(dirname, value)):
+            options.extend([option, os.path.join(dirname, value)])
+
+        elif option in ("-e", "--editable"):
+            # Rez packages are never editable
+            names.append(value)
+
+        else:
+            options.extend([option] + ([value] if value else []))
+
+    return names, options
+
+
+def split_requirements(names, groups):
+    """Split `names` into at most `groups` groups of similar size"""
+    groups = max(1, min(groups, len(names)))
+    return [names[index::groups] for index in range(groups)]
+
+
+def _constraint(name):
+    """Return requirement `name` as a pip constraint, if it constrains
+
+    Constraints may only carry a name, version specifier and markers,
+    e.g. "requests[security]>=2" constrains as "requests>=2", whereas
+    "requests" and URLs constrain nothing.
+
+    """
+
+    match = re.match(r"([\w.-]+)\s*(?:\[[^\]]*\])?\s*([<>=!~].*)$", name)
+
+    if match is None or "@" in name:
+        return None
+
+    return "%s%s" % match.groups()
+
+
+def resolve(names, index=None, extra_args=None, on_progress=None):
+    """Ask pip what it would install for `names`, without installing
+
+    Unlike `download`, nothing is installed and at most the metadata
+    of each distribution is downloaded.
+
+    Arguments:
+        names (list): Names of packages to install, in pip-format
+        index (str, optional): See `download`
+        extra_args (list, optional): See `download`
+        on_progress (callable, optional): See `call`
+
+    Returns:
+        resolutions (list): Of `Resolution`, one per distribution
+
+    Raises:
+        OSError: On pip older than 22.2, which introduced --report
+
+    """
+
+    if version_tuple(pip_version()) < (22, 2):
+        raise OSError("Resolving first requires pip>=22.2, found pip-%s"
+                      % pip_version())
+
+    extra_args = list(extra_args or []) + _index_args(index)
+    tempdir = tempfile.mkdtemp(prefix="pipz-resolve-")
+    report = os.path.join(tempdir, "report.json")
+
+    cmd = [
+        "python", "-m", "pip", "install",
+        "--dry-run",
+        "--ignore-installed",
+        "--report", report,
+        "--use-pep517",
+        "--disable-pip-version-check",
+    ] + extra_args + list(names)
+
+    try:
+        call(cmd, on_progress=on_progress)
+
+        with open(report) as f:
+            return _read_report(json.load(f))
+
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def _read_report(report):
+    """Parse the --report of pip into a `Resolution` per distribution
+
+    https://pip.pypa.io/en/stable/reference/installation-report/
+
+    """
+
+    resolutions = list()
+
+    for item in report.get("install", []):
+        metadata = item["metadata"]
+        url = item["download_info"]["url"]
+
+        # E.g. https://host/six-1.12.0-py2.py3-none-any.whl#sha256=...
+        fname = url.split("#", 1)[0].rsplit("/", 1)[-1]
+
+        resolutions.append(Resolution(
+            name=metadata["name"],
+            version=metadata["version"],
+            url=url if item.get("is_direct") else None,
+            variants=(
+                wheel_to_variants(_wheel_from_filename(fname))
+                if fname.endswith(".whl") else None
+            ),
+        ))
+
+    return resolutions
+
+
+class Resolution(object):
+    """A distribution pip would install, see `resolve`
+
+    Carries the name, version and variant the Rez package would have,
+    such that it may be looked up before it's downloaded.
+
+    Arguments:
+        name (str): Name of distribution, e.g. "PyYAML"
+        version (str): Version of distribution, e.g. "5.1"
+        url (str, optional): Where the distribution was explicitly
+            requested from, e.g. a path or git URL
+        variants (list, optional): Variant requirements, e.g.
+            ["python-3"], or None when only known once built, such
+            as for source distributions
+
+    """
+
+    def __init__(self, name, version, url=None, variants=None):
+        self.distribution = name
+        self.name = _rez_name(re.sub(r"[^A-Za-z0-9.]+", "-", name))
+        self.version = version
+        self.url = url
+        self.variants = [variants] if variants else []
+        self.known = variants is not None
+
+    @property
+    def requirement(self):
+        """This exact distribution, in pip-format"""
+        if self.url:
+            return "%s @ %s" % (self.distribution, self.url)
+
+        return "%s==%s" % (self.distribution, self.version)
+
+    def __repr__(self):
+        return "Resolution(%s-%s)" % (self.name, self.version)
+
+
+def plan(resolutions, repository, variants=None):
+    """Split `resolutions` by whether they exist in `repository`
+
+    A package is only as it would be converted by `convert`, any
+    preprocessing of the Rez package is not taken into account.
+
+    Arguments:
+        resolutions (list): Of `Resolution`, as returned by `resolve`
+        repository (RepositoryIndex): Where to look
+        variants (list, optional): Variant requirements every package
+            is converted with, as passed to `convert`, replacing those
+            of each resolution
+
+    Returns:
+        missing, existing (tuple): Lists of `Resolution`, where those
+            whose variant is unknown are always missing
+
+    """
+
+    missing, existing = list(), list()
+
+    for resolution in resolutions:
+        if variants:
+            resolution.variants = [list(variants)]
+            resolution.known = True
+
+        if resolution.known and repository.has_variant(
+                resolution.name,
+                resolution.version,
+                resolution.variants[0] if resolution.variants else []):
+            existing.append(resolution)
+        else:
+            missing.append(resolution)
+
+    return missing, existing
+
+
+def _wheel_from_filename(fname):
+    """Return WHEEL equivalent of the tags in filename `fname`
+
+    E.g. six-1.12.0-py2.py3-none-any.whl -> Tag: py2-none-any ...
+
+    """
+
+    return "\n".join(["Wheel-Version: 1.0"] + [
+        "Tag: %s" % tag for tag in _wheel_tags(fname)
+    ])
+
+
+def _wheel_tags(fname):
+    """Return tags of filename `fname`, e.g. ["py2-none-any", ...]"""
+
+    # {distribution}-{version}(-{build})?-{python}-{abi}-{platform}.whl
+    python, abi, platform = fname[:-len(".whl")].split("-")[-3:]
+
+    return [
+        "%s-%s-%s" % tag
+        for tag in itertools.product(python.split("."),
+                                     abi.split("."),
+                                     platform.split("."))
+    ]
+
+
+def version_tuple(version):
+    """Return comparable tuple of `version`, e.g. "22.10" -> (22, 10)"""
+    parts = list()
+
+    for part in str(version).split("."):
+        match = re.match(r"\d+", part)
+
+        if match is None:
+            break
+
+        parts.append(int(match.group()))
+
+    return tuple(parts)
+
+
+def _index_args(index):
+    """Return pip arguments for using `index`"""
+    if not index:
+        return []
+
+    if not os.path.isdir(index):
+        return ["--index-url", index]
+
+    # A local wheelhouse, resolved from disk alone. Any index
+    # configured for pip, such as an --extra-index-url in pip.conf
+    # would otherwise still be consulted.
+    if _indexed(index):
+        return ["--isolated", "--index-url", wheelhouse.index_url(index)]
+
+    return ["--no-index", "--find-links", os.path.abspath(index)]
+
+
+def _indexed(directory):
+    """Has `directory` an index as up to date as its wheels?
+
+    pip reads only the page of each project from an index, see
+    `pipz.wheelhouse.build`, rather than every filename of the
+    directory. Wheels added since it was built leave it out of date.
+
+    """
+
+    built = _getmtime(os.path.join(directory, "simple", "index.html"))
+    return built is not None and built >= _getmtime(directory)
+
+
+def _target_args(python=None, platform=None):
+    """Return pip arguments for downloading for another Python or platform"""
+    args = list()
+
+    if python:
+        args += ["--python-version", python]
+
+    if platform:
+        args += ["--platform", platform]
+
+    if args:
+        # Anything else would have to be built, by the Python in use
+        args += ["--only-binary=:all:"]
+
+    return args
+
+
+def _find_distributions(path, cached=False, direct=False, python=None):
+    from pkg_resources import find_distributions
+
+    distributions = sorted(
+        _find_wheels(path) if direct else find_distributions(path),
+
+        # Upper-case characters typically come first
+        key=lambda d: d.key
+    )
+
+    # Cached files are shared with future installs
+    # and mustn't be moved during deployment
+    for dist in distributions:
+        dist.cached = cached
+        dist.python = python
+
+    return distributions
+
+
+def _find_wheels(path):
+    """Yield a distribution per wheel in `path`, read from the archive"""
+    for fname in sorted(os.listdir(path)):
+        if not fname.endswith(".whl"):
+            continue
+
+        yield _read_wheel(os.path.join(path, fname))
+
+
+def _read_wheel(fname):
+    """Return distribution of wheel `fname`, read from the archive"""
+    import email
+    import pkg_resources
+
+    metadata = WheelMetadata(fname)
+    pkg_info = email.message_from_string(metadata.get_metadata("METADATA"))
+
+    distribution = pkg_resources.DistInfoDistribution(
+        location=metadata.fname,
+        metadata=metadata,
+        project_name=pkg_resources.safe_name(pkg_info["Name"]),
+        version=pkg_info["Version"],
+    )
+
+    distribution.cached = False
+    distribution.python = None
+
+    return distribution
+
+
+class WheelMetadata(object):
+    """Metadata of a wheel, read from within the archive
+
+    Provides the metadata interface of pkg_resources, such that a wheel
+    is used like any distribution installed by pip, but isn't extracted.
+
+    Arguments:
+        fname (str): Absolute path to .whl file
+
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+
+        with zipfile.ZipFile(fname) as whl:
+            self._names = set(whl.namelist())
+
+        # E.g. six-1.12.0.dist-info/METADATA
+        self.dist_info = next((
+            name.split("/")[0] for name in sorted(self._names)
+            if name.count("/") == 1 and
+            name.endswith(".dist-info/METADATA")
+        ), None)
+
+        if self.dist_info is None:
+            raise OSError("%s had no .dist-info/METADATA" % fname)
+
+        self._cache = dict()
+
+    def has_metadata(self, name):
+        return "%s/%s" % (self.dist_info, name) in self._names
+
+    def get_metadata(self, name):
+        if name not in self._cache:
+            with zipfile.ZipFile(self.fname) as whl:
+                self._cache[name] = whl.read(
+                    "%s/%s" % (self.dist_info, name)).decode("utf-8")
+
+        return self._cache[name]
+
+    def get_metadata_lines(self, name):
+        from pkg_resources import yield_lines
+        return yield_lines(self.get_metadata(name))
+
+    def metadata_isdir(self, name):
+        prefix = "%s/%s/" % (self.dist_info, name)
+        return any(member.startswith(prefix) for member in self._names)
+
+    def metadata_listdir(self, name):
+        prefix = "%s/%s/" % (self.dist_info, name)
+        return sorted(set(
+            member[len(prefix):].split("/")[0]
+            for member in self._names
+            if member.startswith(prefix)
+        ))
+
+    def run_script(self, script_name, namespace):
+        raise NotImplementedError("Wheels have no scripts to run")
+
+
+def exists(package, path):
+    """Does `distribution` already exists as a Rez-package in `path`?
+
+    Arguments:
+        package (rez.Package):
+        path (str): Absolute path of where to look
+
+    """
+
+    with _rez_lock:
+        try:
+            variant = next(package.iter_variants())
+        except StopIteration:
+            return False
+
+        return variant.install(path, dry_run=True) is not None
+
+
+def exists_all(packages, paths):
+    """Which of `packages` already exist in any of `paths`?
+
+    Equivalent to calling `exists` for each package and path,
+    but each repository is only ever read once.
+
+    Arguments:
+        packages (list): Packages previously passed through `convert`
+        paths (list): Absolute paths of repositories to look in
+
+    Returns:
+        exists (list): One bool per package
+
+    """
+
+    with tracing.span("exists", packages=len(packages), paths=paths):
+        index = RepositoryIndex(paths)
+        return [index.exists(package) for package in packages]
+
+
+class RepositoryIndex(object):
+    """In-memory index of (family, version, variant) of repositories
+
+    Families and versions are read from the filesystem alone, and the
+    package definition of a version only once it is first queried.
+    Each directory is listed at most once.
+
+    Unlike `exists`, only the variant is compared, not the remainder of
+    the package definition, such as `requires`.
+
+    Arguments:
+        paths (list): Absolute paths to filesystem package repositories
+        revalidate (bool, optional): Re-read what has been modified since
+            it was last read, for an index kept across installs and
+            shared with other writers, at the cost of a stat per query
+
+    """
+
+    def __init__(self, paths, revalidate=False):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.revalidate = revalidate
+        self._families = dict()  # path -> set(family)
+        self._versions = dict()  # (path, family) -> set(version)
+        self._variants = dict()  # (path, family, version) -> set(variant)
+        self._mtimes = dict()  # dirname or package.py -> mtime when read
+
+    def exists(self, package):
+        """Does a variant of `package` exist in any of our paths?"""
+        try:
+            variant = next(package.iter_variants())
+        except StopIteration:
+            return False
+
+        return self.has_variant(package.name,
+                                str(package.version),
+                                variant.variant_requires or [])
+
+    def has_variant(self, family, version, requires):
+        """Does `family-version` exist with variant `requires`?
+
+        Arguments:
+            family (str): Name of package
+            version (str): Version of package
+            requires (list): Requirements of variant, empty for
+                a package without variants
+
+        """
+
+        requires = tuple(str(req) for req in requires)
+
+        for path in self.paths:
+            variants = self.variants(path, family, str(version))
+
+            if variants is None:
+                continue
+
+            if requires in variants:
+                return True
+
+        return False
+
+    def variants(self, path, family, version):
+        """Return variant requirements of `family-version` in `path`
+
+        Returns:
+            variants (set): Of tuples of str, where `()` is a package
+                without variants, or None if the package doesn't exist
+
+        """
+
+        key = (path, family, version)
+
+        if self.revalidate:
+            fname = os.path.join(path, family, version, "package.py")
+            self._expire(self._variants, key, fname)
+
+        if key not in self._variants:
+            self._variants[key] = self._read_variants(path, family, version)
+
+        return self._variants[key]
+
+    def invalidate(self, family=None):
+        """Forget what was read, e.g. after installing into a repository"""
+        if family is None:
+            self._families.clear()
+            self._versions.clear()
+            self._variants.clear()
+            return
+
+        for cache in (self._versions, self._variants):
+            for key in list(cache):
+                if key[1] == family:
+                    del cache[key]
+
+        for families in self._families.values():
+            families.discard(family)
+
+    def _read_variants(self, path, family, version):
+        if family not in self._listdir(self._families, path, path):
+            return None
+
+        key = (path, family)
+        if version not in self._listdir(self._versions, key,
+                                        os.path.join(path, family)):
+            return None
+
+        from rez.packages_ import get_package
+
+        try:
+            with _rez_lock:
+                package = get_package(family, version, paths=[path])
+        except Exception as e:
+            # E.g. a broken package definition, rez will tell us more
+            _log.debug("Could not read %s-%s: %s" % (family, version, e))
+            return None
+
+        if package is None:
+            return None
+
+        if not package.variants:
+            return set([()])
+
+        return set(
+            tuple(str(req) for req in requires)
+            for requires in package.variants
+        )
+
+    def _expire(self, cache, key, fname):
+        """Forget `key` of `cache` once `fname` has been modified"""
+        mtime = _getmtime(fname)
+
+        if key in cache and self._mtimes.get(fname) != mtime:
+            del cache[key]
+
+        if key not in cache:
+            self._mtimes[fname] = mtime
+
+    def _listdir(self, cache, key, dirname):
+        if self.revalidate:
+            self._expire(cache, key, dirname)
+
+        if key not in cache:
+            try:
+                cache[key] = set(os.listdir(dirname))
+            except OSError:
+                cache[key] = set()
+
+        return cache[key]
+
+
+def convert(distribution,
+            variants=None,
+            dumb=False,
+            python=None,
+            zipped=False):
+    """Make a Rez package out of `distribution`
+
+    Arguments:
+        distribution (distlib.database.InstalledDistribution): Source
+        variants (list, optional): Explicitly provide variants, defaults
+            to automatically detecting the correct variants using the
+            WHEEL metadata of `distribution`.
+        python (str, optional): Version of Python `distribution` was
+            downloaded for, defaults to that of `download`
+        zipped (bool, optional): Deploy libraries as {root}/python.zip,
+            rather than {root}/python, where `distribution` supports it,
+            see `zippable`
+
+    Returns:
+        package (rez.Package): With `distribution` as `package.distribution`,
+            for `deploy`. Nothing else holds on to either.
+
+    """
+
+    with tracing.span("convert", package=distribution.project_name):
+        with _rez_lock:
+            return _convert(distribution,
+                            variants=variants,
+                            dumb=dumb,
+                            python=python,
+                            zipped=zipped)
+
+
+def _convert(distribution, variants=None, dumb=False, python=None,
+             zipped=False):
+    from rez.package_maker__ import PackageMaker
+    from rez.developer_package import DeveloperPackage
+
+    # determine variant requirements
+    variants_ = variants or []
+
+    if not variants_:
+        variants_.extend(_variants_from_distribution(distribution, python))
+
+    requirements = _pip_to_rez_requirements(distribution)
+
+    maker = PackageMaker(_rez_name(distribution.project_name),
+                         package_cls=DeveloperPackage)
+    maker.version = distribution.version
+
+    if requirements:
+        maker.requires = requirements
+
+    if variants_:
+        maker.variants = [variants_]
+
+    if zipped and not dumb:
+        reason = zippable(distribution)
+
+        if reason:
+            _log.debug("Deploying %s as a directory, %s"
+                       % (distribution.project_name, reason))
+            zipped = False
+
+    maker.commands = '\n'.join([
+        "env.PATH.prepend('{root}/bin')",
+        "env.PYTHONPATH.prepend('{root}/%s')" % (
+            "python.zip" if zipped else "python")
+    ])
+
+    package = maker.get_package()
+    data = maker._get_data()
+    data["pipz"] = True  # breadcrumb for preprocessing
+
+    # preprocessing
+    result = package._get_preprocessed(data)
+
+    if result:
+        package, data = result
+
+    # Store reference for deployment, for as long as the package lives
+    distribution.dumb = dumb
+    distribution.zipped = bool(zipped and not dumb)
+    package.distribution = distribution
+
+    return package
+
+
+def _dumb_files_from_distribution(dist):
+    """RECORD can split multiple PyPI packages into multiple Rez packages
+
+    This cannot.s
+
+    """
+
+    for base, dirs, files in os.walk(dist.location):
+        for fname in files:
+            abspath = os.path.join(base, fname)
+            relpath = os.path.relpath(abspath, dist.location)
+
+            yield relpath
+
+
+def _files_from_distribution(dist):
+    """(Almost) Every file of a distribution is documented in the RECORD file
+
+    https://www.python.org/dev/peps/pep-0427/#the-dist-info-directory
+
+    """
+
+    for relpath, digest, size in _record_from_distribution(dist):
+        yield relpath
+
+
+def _record_from_distribution(dist):
+    """Parse RECORD of `dist` into (relpath, sha256, size) entries
+
+    The sha256 is given as a hex digest, and both it and the size
+    are None for files RECORD doesn't carry a hash for, such as
+    RECORD itself.
+
+    """
+
+    RECORD = dist.get_metadata("RECORD").splitlines()
+
+    for row in csv.reader(RECORD):
+        if not row:
+            continue
+
+        relpath = row[0].replace("\\", "/")
+
+        if _exclude.search(relpath):
+            continue
+
+        digest, size = None, None
+
+        if len(row) > 2 and row[1].startswith("sha256="):
+            digest = _record_to_hex(row[1][len("sha256="):])
+            size = int(row[2]) if row[2] else None
+
+        yield relpath, digest, size
+
+
+def distribution_size(distribution):
+    """Return bytes `distribution` will take up once deployed
+
+    Sizes are read from RECORD, rather than from the files themselves,
+    other than for the few files RECORD carries no size for, such as
+    RECORD itself. Files that aren't deployed aren't counted.
+
+    Arguments:
+        distribution (pkg_resources.Distribution): As passed to `convert`
+
+    """
+
+    wheel = _is_wheel(distribution)
+
+    if getattr(distribution, "dumb", False):
+        if wheel:
+            with zipfile.ZipFile(distribution.location) as whl:
+                return sum(info.file_size for info in whl.infolist())
+
+        return sum(
+            _getsize(os.path.join(distribution.location, relpath))
+            for relpath in _dumb_files_from_distribution(distribution)
+        )
+
+    total = 0
+    infos = None
+
+    if wheel:
+        data = distribution.dist_info[:-len(".dist-info")] + ".data/"
+
+    for relpath, digest, size in _record_from_distribution(distribution):
+        if relpath.startswith("../") or (
+                wheel and _wheel_destination(relpath, data) is None):
+            continue
+
+        if size is not None:
+            total += size
+
+        elif wheel:
+            if infos is None:
+                with zipfile.ZipFile(distribution.location) as whl:
+                    infos = dict((i.filename, i) for i in whl.infolist())
+
+            info = infos.get(relpath)
+            total += info.file_size if info else 0
+
+        else:
+            total += _getsize(os.path.join(distribution.location, relpath))
+
+    return total
+
+
+def _is_wheel(distribution):
+    """Was `distribution` downloaded with `direct=True`?"""
+    return isinstance(distribution.location, _basestring) and (
+        distribution.location.endswith(".whl"))
+
+
+def zippable(distribution):
+    """Can `distribution` be imported from a zip archive?
+
+    Only pure-Python libraries are, with no native extensions, no
+    resources other than their own metadata and no module relying
+    on `__file__` to locate anything on disk.
+
+    Arguments:
+        distribution (pkg_resources.Distribution): As passed to `convert`
+
+    Returns:
+        reason (str): Why `distribution` cannot be zipped, or None
+
+    """
+
+    if not re.search(r"^Root-Is-Purelib:\s*true\s*$",
+                     distribution.get_metadata("WHEEL"),
+                     re.IGNORECASE | re.MULTILINE):
+        return "not pure-Python"
+
+    wheel = _is_wheel(distribution)
+    modules = list()
+
+    if wheel:
+        data = distribution.dist_info[:-len(".dist-info")] + ".data/"
+
+    for relpath, digest, size in _record_from_distribution(distribution):
+        if relpath.startswith("../") or (
+                relpath.split("/", 1)[0].endswith(".dist-info")):
+            continue
+
+        if wheel:
+            destination = _wheel_destination(relpath, data)
+
+            # Scripts go into {root}/bin either way
+            if destination is None or not destination.startswith("python/"):
+                continue
+
+        basename = os.path.basename(relpath)
+        ext = os.path.splitext(basename)[1].lower()
+
+        if ext in _native_extensions:
+            return "has native extension %s" % relpath
+
+        if ext in (".py", ".pyi") or basename == "py.typed":
+            if ext == ".py":
+                modules.append(relpath)
+            continue
+
+        return "has resource %s" % relpath
+
+    for relpath, source in _read_files(distribution, modules):
+        if b"__file__" in source:
+            return "%s uses __file__" % relpath
+
+    return None
+
+
+_native_extensions = (".so", ".pyd", ".dll", ".dylib")
+
+
+def _read_files(distribution, relpaths):
+    """Yield (relpath, bytes) of each of `relpaths` of `distribution`"""
+    if _is_wheel(distribution):
+        with zipfile.ZipFile(distribution.location) as whl:
+            for relpath in relpaths:
+                yield relpath, whl.read(relpath)
+
+    else:
+        for relpath in relpaths:
+            fname = os.path.join(distribution.location, relpath)
+
+            # RECORD may list files pip didn't end up writing
+            if os.path.exists(fname):
+                with open(fname, "rb") as f:
+                    yield relpath, f.read()
+
+
+def zip_directory(dirname, fname):
+    """Write every file of `dirname` into archive `fname`
+
+    Members are sorted and given a fixed date and permissions, such
+    that the same files always make for the same archive, whichever
+    umask they were written with.
+
+    Returns:
+        files (int): Number of files archived
+
+    """
+
+    members = list()
+
+    for base, dirs, files in os.walk(dirname):
+        for basename in files:
+            abspath = os.path.join(base, basename)
+            relpath = os.path.relpath(abspath, dirname).replace("\\", "/")
+            members.append((relpath, abspath))
+
+    with zipfile.ZipFile(fname, "w", zipfile.ZIP_DEFLATED) as archive:
+        for relpath, abspath in sorted(members):
+            info = zipfile.ZipInfo(relpath, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 3  # Unix, for its permissions
+
+            executable = os.stat(abspath).st_mode & 0o111
+            info.external_attr = (
+                stat.S_IFREG | (0o755 if executable else 0o644)) << 16
+
+            with open(abspath, "rb") as f:
+                archive.writestr(info, f.read())
+
+    return len(members)
+
+
+# Files compiled at install-time, any part of a path matching is excluded
+_exclude = re.compile(r"__pycache__|\.pyc(/|$)")
+
+
+def _record_to_hex(digest):
+    """RECORD stores digests as urlsafe base64, without padding"""
+    digest = digest + "=" * (-len(digest) % 4)
+    digest = base64.urlsafe_b64decode(digest.encode("ascii"))
+    return binascii.hexlify(digest).decode("ascii")
+
+
+# Return sha256 hex digest and size of a file
+_hash_file = manifest.hash_file
+
+
+def deploy(package,
+           path,
+           shim="binary",
+           as_bundle=False,
+           transfer="copy",
+           store=None):
+    """Deploy `distribution` as `package` at `path`
+
+    Arguments:
+        package (rez.Package): Source package
+        path (str): Path to install directory, e.g. "~/packages"
+        shim (str): Windows-only, whether to generate binary or bat scripts.
+            Valid input is "binary" or "bat", default is "binary".
+        as_bundle (bool): Deploy packages as one bundle. No variant will be
+            installed nor returned if this is `True`.
+        transfer (str, optional): How files are brought over from the
+            staging directory, see `transfer_file`. Default is "copy".
+            Wheels downloaded with `direct=True` are always extracted.
+        store (str, optional): Absolute path to a content-addressed store,
+            shared across packages. Files are kept once in the store and
+            linked into `package`, see `store_file`.
+
+    """
+
+    if as_bundle:
+        # Packages may be deployed from multiple threads,
+        # so we can't rely on the current working directory
+        root = os.path.abspath(path)
+        _makedirs(root)
+
+        with tracing.span("deploy", package=package.name) as attrs:
+            _deploy_files(package, root, attrs, shim, transfer, store)
+
+        return None
+
+    with _rez_lock:
+        variant = next(package.iter_variants())
+        root = _variant_root(package, path)
+
+    # Files are written out of sight, and published along with the
+    # package definition once complete, such that anyone resolving
+    # the package never sees it half-way deployed.
+    staging = _staging_dir(path)
+
+    try:
+        with tracing.span("deploy", package=package.name) as attrs:
+            _deploy_files(package, staging, attrs, shim, transfer, store)
+
+            if getattr(package.distribution, "zipped", False):
+                python = os.path.join(staging, "python")
+                zip_directory(python, python + ".zip")
+                shutil.rmtree(python)
+
+            _write_manifest(package, staging, shim)
+
+        _publish(staging, root)
+
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    with _rez_lock:
+        variant_ = variant.install(path)
+
+    return variant_
+
+
+def _deploy_files(package,
+                  destination_root,
+                  attrs,
+                  shim="binary",
+                  transfer="copy",
+                  store=None):
+    """Write files of `package` to `destination_root`, see `deploy`"""
+    distribution = package.distribution
+    mode = transfer
+
+    if _is_wheel(distribution):
+        attrs["files"], attrs["bytes"] = extract_wheel(
+            distribution, destination_root, store=store)
+
+        return _deploy_console_scripts(distribution, destination_root, shim)
+
+    if mode == "move" and getattr(distribution, "cached", False):
+        mode = "copy"
+
+    # Store files from distribution for deployment
+    files = list()
+
+    if distribution.dumb:
+        for relpath in _dumb_files_from_distribution(distribution):
+            files += [(distribution.location, relpath, None, None)]
+
+    else:
+        for relpath, digest, size in (
+                _record_from_distribution(distribution)):
+
+            # E.g. scripts, written outside of the staging directory
+            if relpath.startswith("../"):
+                continue
+
+            files += [(distribution.location, relpath, digest, size)]
+
+    dirnames = set()
+    attrs["files"] = len(files)
+
+    if tracing.enabled():
+        attrs["bytes"] = sum(
+            size if size is not None else _getsize(
+                os.path.join(source_root, relpath))
+            for source_root, relpath, digest, size in files
+        )
+
+    for source_root, relpath, digest, size in files:
+        src = os.path.join(source_root, relpath)
+        src = os.path.normpath(src)
+
+        dst = _within(destination_root, "python/" + relpath)
+
+        dirname = os.path.dirname(dst)
+        if dirname not in dirnames:
+            _makedirs(dirname)
+            dirnames.add(dirname)
+
+        try:
+            if store and digest:
+                link_from_store(store, src, dst, digest, mode=mode)
+            else:
+                transfer_file(src, dst,
+                              mode=mode,
+                              digest=digest,
+                              size=size)
+
+        except IntegrityError as e:
+            if not _tolerated(distribution, relpath):
+                raise
+
+            _log.warning(str(e))
+            shutil.copyfile(src, dst)
+
+        except (OSError, IOError) as e:
+            # RECORD may list files pip didn't end up writing
+            if e.errno != errno.ENOENT or os.path.exists(src):
+                raise
+
+    _deploy_console_scripts(distribution, destination_root, shim)
+
+
+def _tolerated(distribution, relpath):
+    """May `relpath` of staged `distribution` be deployed despite RECORD?
+
+    Distributions share one staging directory, and may overwrite each
+    other's files, e.g. tests/__init__.py. Some wheels also carry stale
+    RECORD entries for their own metadata, e.g. METADATA of PySide2-5.12.
+    Any other file not matching RECORD is damaged.
+
+    """
+
+    own = os.path.basename(distribution.egg_info)
+
+    if relpath.startswith(own + "/"):
+        return True
+
+    for name in os.listdir(distribution.location):
+        if name == own or not name.endswith(".dist-info"):
+            continue
+
+        try:
+            with open(os.path.join(distribution.location,
+                                   name, "RECORD")) as f:
+                rows = list(csv.reader(f))
+
+        except (OSError, IOError):
+            continue
+
+        if any(row and row[0].replace("\\", "/") == relpath for row in rows):
+            return True
+
+    return False
+
+
+def _deploy_console_scripts(distribution, destination_root, shim="binary"):
+    console_scripts = find_console_scripts(distribution)
+
+    if not console_scripts:
+        return
+
+    dst = os.path.join(destination_root, "bin")
+    dst = os.path.normpath(dst)
+
+    if not os.path.exists(dst):
+        os.makedirs(dst)
+
+    for exe, command in console_scripts.items():
+        write_console_script(dst, exe, command, shim == "binary")
+
+
+def _write_manifest(package, root, shim="binary"):
+    """Write manifest of `package` deployed at `root`, see `pipz.manifest`
+
+    Files are listed as deployed, with hashes from RECORD where
+    available, and with what's needed to download them again.
+
+    """
+
+    distribution = package.distribution
+    wheel = _is_wheel(distribution)
+    known = dict()  # relpath -> (sha256, size, source)
+
+    if wheel:
+        data = distribution.dist_info[:-len(".dist-info")] + ".data/"
+
+    if distribution.dumb and wheel:
+        with zipfile.ZipFile(distribution.location) as whl:
+            record = [(name, None, None) for name in whl.namelist()]
+
+    elif distribution.dumb:
+        record = [
+            (relpath.replace("\\", "/"), None, None)
+            for relpath in _dumb_files_from_distribution(distribution)
+        ]
+
+    else:
+        record = _record_from_distribution(distribution)
+
+    for source, digest, size in record:
+        if source.startswith("../"):
+            continue
+
+        relpath = (
+            _wheel_destination(source, data) if wheel
+            else "python/" + source
+        )
+
+        if relpath is not None:
+            known[relpath] = (digest, size, source)
+
+    files = list()
+
+    for base, dirs, fnames in os.walk(root):
+        for fname in fnames:
+            relpath = os.path.relpath(os.path.join(base, fname), root)
+            relpath = relpath.replace("\\", "/")
+            digest, size, source = known.get(relpath, (None, None, None))
+            files.append((relpath, digest, size, source))
+
+    variant = next(package.iter_variants())
+
+    manifest.write(
+        root, files,
+        requirement="%s==%s" % (distribution.project_name,
+                                distribution.version),
+        python=getattr(distribution, "python", None),
+        direct=wheel,
+        dumb=distribution.dumb,
+        zipped=getattr(distribution, "zipped", False),
+        variant=[str(req) for req in variant.variant_requires or []],
+        shim=shim,
+    )
+
+
+def repair(root, index=None, extra_args=None, damaged=None):
+    """Restore files of the package at `root` that are missing or modified
+
+    The package is downloaded again, the way it originally was, and
+    deployed to a temporary directory from which only damaged files
+    are copied, each verified against the manifest of `root`.
+
+    Arguments:
+        root (str): Absolute path to root of package, with a manifest
+        index (str, optional): Download from this index, see `download`
+        extra_args (list, optional): Additional arguments passed to `pip`
+        damaged (list, optional): As returned by `pipz.manifest.verify`,
+            which is called unless given
+
+    Returns:
+        repaired (list): Relative paths of repaired files
+
+    Raises:
+        OSError: On `root` having no manifest, or a file not
+            being restored exactly as originally deployed
+
+    """
+
+    info = manifest.read(root)
+
+    if info is None:
+        raise OSError("%s has no manifest" % root)
+
+    if damaged is None:
+        damaged = manifest.verify(root, info)
+
+    if not damaged:
+        return []
+
+    entries = dict((entry[0], entry) for entry in info["files"])
+    tempdir = tempfile.mkdtemp(suffix="-rez", prefix="pip-")
+
+    try:
+        distributions = download(
+            [info["requirement"]],
+            tempdir=os.path.join(tempdir, "download"),
+            index=index,
+            extra_args=list(extra_args or []) + ["--no-deps"],
+            direct=info["direct"],
+            python=info["python"],
+        )
+
+        name, _, version = info["requirement"].partition("==")
+        distribution = next(dist for dist in distributions
+                            if dist.project_name == name)
+
+        package = convert(distribution,
+                          variants=info["variant"] or None,
+                          dumb=info["dumb"],
+                          zipped=info["zipped"])
+
+        staged = os.path.join(tempdir, "package")
+        _deploy_files(package, staged, dict(), shim=info["shim"])
+
+        if package.distribution.zipped:
+            python = os.path.join(staged, "python")
+            zip_directory(python, python + ".zip")
+
+        for relpath, reason in damaged:
+            _, digest, size = entries[relpath][:3]
+            src = _within(staged, relpath)
+            dst = _within(root, relpath)
+
+            if not os.path.exists(src):
+                raise OSError("%s is missing from %s as downloaded again"
+                              % (relpath, info["requirement"]))
+
+            _makedirs(os.path.dirname(dst))
+
+            # May be linked to other packages, e.g. via a store
+            if os.path.lexists(dst):
+                os.remove(dst)
+
+            copy_verified(src, dst, digest=digest, size=size)
+            shutil.copymode(src, dst)
+
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    repaired = [relpath for relpath, reason in damaged]
+    manifest.touch(root, repaired)
+
+    return repaired
+
+
+def _variant_root(package, path):
+    variant = next(package.iter_variants())
+
+    return os.path.abspath(os.path.join(
+        path, package.name, str(package.version), variant.subpath or ""
+    ))
+
+
+def compile_all(packages, path, python="python"):
+    """Byte-compile the Python files of each of `packages` at `path`
+
+    Each interpreter compiles every package made for it in one go, across
+    all cores, writing deterministic pycs validated by the hash of their
+    source rather than its modification time, where supported (3.7+).
+
+    Packages made for a version of Python other than that of `python`,
+    e.g. with `download(python="2.7")`, are compiled by e.g. `python2.7`
+    on PATH, or skipped if there is none.
+
+    Arguments:
+        packages (list): Packages previously passed through `deploy`
+        path (str): Path to install directory, e.g. "~/packages"
+        python (str, optional): Name or path of interpreter for packages
+            not specific to any version of Python
+
+    Returns:
+        skipped (list): Packages without an interpreter to compile them
+
+    """
+
+    default = probe(python).get("python_version")
+    interpreters = dict()  # version -> (executable, [dirname])
+    skipped = list()
+
+    for package in packages:
+        dirname = os.path.join(_variant_root(package, path), "python")
+
+        if not os.path.isdir(dirname):
+            continue
+
+        version = default
+        variant = next(package.iter_variants())
+
+        for requirement in variant.variant_requires or []:
+            if requirement.name == "python" and str(requirement.range):
+                version = str(requirement.range)
+
+        if default and (default + ".").startswith(version + "."):
+            version = default
+
+        if version not in interpreters:
+            executable = probe(
+                python if version == default else "python%s" % version
+            ).get("executable")
+
+            interpreters[version] = (executable, list())
+
+        executable, dirnames = interpreters[version]
+
+        if executable is None:
+            _log.warning("Skipped compiling %s-%s, python%s not found"
+                         % (package.name, package.version, version))
+            skipped.append(package)
+            continue
+
+        dirnames.append(dirname)
+
+    for version, (executable, dirnames) in sorted(interpreters.items()):
+        if not dirnames:
+            continue
+
+        cmd = [executable, "-m", "compileall", "-q"]
+        actual = version_tuple(probe(executable)["python_version"])
+
+        if actual >= (3, 5):
+            # All cores
+            cmd += ["-j", "0"]
+
+        if actual >= (3, 7):
+            cmd += ["--invalidation-mode", "checked-hash"]
+
+        with tracing.span("compile", python=executable, packages=len(dirnames)):
+            call(cmd + dirnames)
+
+    return skipped
+
+
+# Where packages are deployed before being published, next
+# to the packages themselves such that they may be renamed
+_staging_dirname = ".pipz-staging"
+
+# Seconds after which leftovers from e.g. a killed process are removed
+_staging_max_age = 24 * 3600
+
+# Repositories cleaned by this process
+_staging_cleaned = set()
+_staging_lock = threading.Lock()
+
+
+def _staging_dir(path):
+    """Return a new directory to deploy a package into, see `_publish`
+
+    Leftovers from past deployments are removed, once per process.
+
+    """
+
+    import socket
+
+    staging = os.path.join(os.path.abspath(path), _staging_dirname)
+
+    with _staging_lock:
+        if staging not in _staging_cleaned:
+            _staging_cleaned.add(staging)
+            clean_staging(path)
+
+    _makedirs(staging)
+
+    # Unlike tempfile.mkdtemp, permissions follow the umask
+    # as they would for any directory of the repository
+    dirname = os.path.join(staging, "%s-%d-%s" % (
+        socket.gethostname(),
+        os.getpid(),
+        binascii.hexlify(os.urandom(4)).decode("ascii"),
+    ))
+
+    os.mkdir(dirname)
+    return dirname
+
+
+def clean_staging(path, max_age=_staging_max_age):
+    """Remove staging directories in `path` older than `max_age` seconds
+
+    Deployments in progress, by this or any other process or machine,
+    are younger and left alone.
+
+    Returns:
+        removed (list): Absolute paths to removed directories
+
+    """
+
+    staging = os.path.join(os.path.abspath(path), _staging_dirname)
+    removed = list()
+
+    try:
+        names = os.listdir(staging)
+    except OSError:
+        return removed
+
+    for name in names:
+        dirname = os.path.join(staging, name)
+
+        try:
+            age = time.time() - os.path.getmtime(dirname)
+        except OSError:
+            # Published or removed just now
+            continue
+
+        if age < max_age:
+            continue
+
+        _log.debug("Removing stale %s" % dirname)
+        shutil.rmtree(dirname, ignore_errors=True)
+        removed.append(dirname)
+
+    return removed
+
+
+def _publish(staging, root):
+    """Move `staging` into place as `root`, with a single rename
+
+    Where `root` already exists, such as with packages without variants
+    whose root also carries the package definition, or leftovers of an
+    interrupted deployment, each top-level directory is replaced in turn.
+
+    """
+
+    _makedirs(os.path.dirname(root))
+
+    try:
+        os.rename(staging, root)
+        return
+
+    except OSError as e:
+        if e.errno not in (errno.EEXIST, errno.ENOTEMPTY, errno.EACCES):
+            raise
+
+    # E.g. python/ and bin/
+    for name in os.listdir(staging):
+        src = os.path.join(staging, name)
+        dst = os.path.join(root, name)
+
+        if os.path.lexists(dst):
+            # Out of the way first, such that `dst` is never partial.
+            # What's moved aside is removed along with `staging`.
+            os.rename(dst, src + ".old")
+
+        os.rename(src, dst)
+
+
+def extract_wheel(distribution, root, store=None):
+    """Stream each file of wheel `distribution` into package `root`
+
+    Files are verified against RECORD on their way out of the archive,
+    with libraries going into {root}/python and scripts into {root}/bin,
+    as per https://www.python.org/dev/peps/pep-0427/#installing-a-wheel
+
+    Arguments:
+        distribution (pkg_resources.Distribution): Wheel, as returned
+            by `download` with `direct=True`
+        root (str): Absolute path to root of package
+        store (str, optional): Absolute path to content-addressed store,
+            see `store_file`. Files already stored aren't extracted.
+
+    Returns:
+        files, bytes (tuple): Number of files and bytes extracted
+
+    """
+
+    # E.g. six-1.12.0.data/scripts/six.py
+    data = distribution.dist_info[:-len(".dist-info")] + ".data/"
+
+    if distribution.dumb:
+        with zipfile.ZipFile(distribution.location) as whl:
+            record = [
+                (name, None, None) for name in whl.namelist()
+                if not name.endswith("/")
+            ]
+    else:
+        record = list(_record_from_distribution(distribution))
+
+    dirnames = set()
+    files, total = 0, 0
+
+    with zipfile.ZipFile(distribution.location) as whl:
+        for relpath, digest, size in record:
+            dst = _wheel_destination(relpath, data)
+
+            if dst is None:
+                continue
+
+            dst = _within(root, dst)
+
+            dirname = os.path.dirname(dst)
+            if dirname not in dirnames:
+                _makedirs(dirname)
+                dirnames.add(dirname)
+
+            # Scripts are modified on extraction, see `_fix_shebang`
+            script = relpath.startswith(data + "scripts/")
+            stored = store and digest and not script and os.path.join(
+                store, "sha256", digest[:2], digest)
+
+            if stored and os.path.exists(stored):
+                _link_stored(stored, dst)
+
+            else:
+                try:
+                    info = whl.getinfo(relpath)
+                except KeyError:
+                    # RECORD may list files not in the archive, e.g. RECORD.jws
+                    continue
+
+                try:
+                    with whl.open(info) as fsrc:
+                        _copy_verified(fsrc,
+                                       "%s/%s" % (distribution.location,
+                                                  relpath),
+                                       dst, digest, size)
+
+                except IntegrityError as e:
+                    # Stale metadata, see `_tolerated`
+                    if not relpath.startswith(distribution.dist_info + "/"):
+                        raise
+
+                    _log.warning(str(e))
+                    stored = None
+
+                    with whl.open(info) as fsrc:
+                        _copy_verified(fsrc, relpath, dst, None, None)
+
+                if script:
+                    _fix_shebang(dst)
+
+                if script or info.external_attr >> 16 & 0o111:
+                    _make_executable(dst)
+
+                if stored:
+                    # Others may now link to what we've just extracted
+                    store_file(store, dst, digest, mode="hardlink")
+
+            files += 1
+            total += size if size is not None else _getsize(dst)
+
+    return files, total
+
+
+def _wheel_destination(relpath, data):
+    """Return where `relpath` of a wheel goes, relative the package root"""
+    if not relpath.startswith(data):
+        return "python/" + relpath
+
+    # E.g. purelib/six.py
+    scheme, _, relpath = relpath[len(data):].partition("/")
+
+    if scheme in ("purelib", "platlib", "data"):
+        return "python/" + relpath
+
+    if scheme == "scripts":
+        return "bin/" + relpath
+
+    # Headers have nowhere to go, and weren't deployed by pip --target
+    return None
+
+
+def _within(root, relpath):
+    """Return absolute path of `relpath` in `root`
+
+    Paths come from archives and RECORD files, which may be crafted
+    to write anywhere, e.g. "../../../home/me/.bashrc".
+
+    Raises:
+        OSError: On `relpath` being absolute, or leading out of `root`
+
+    """
+
+    root = os.path.normpath(os.path.abspath(root))
+    dst = os.path.normpath(os.path.join(root, relpath))
+
+    if (os.path.isabs(relpath)
+            or os.path.splitdrive(relpath)[0]
+            or not dst.startswith(root + os.sep)):
+        raise OSError("'%s' is outside of the package" % relpath)
+
+    return dst
+
+
+def _fix_shebang(fname):
+    """Scripts of a wheel may run with whichever python is on PATH
+
+    https://www.python.org/dev/peps/pep-0427/#recommended-installer-features
+
+    """
+
+    with open(fname, "rb") as f:
+        first = f.readline()
+
+        if not first.startswith(b"#!python"):
+            return
+
+        rest = f.read()
+
+    with open(fname, "wb") as f:
+        f.write(b"#!/usr/bin/env python" + first[len(b"#!python"):])
+        f.write(rest)
+
+
+def _make_executable(fname):
+    mode = os.stat(fname).st_mode
+    os.chmod(fname, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def _getsize(fname):
+    try:
+        return os.path.getsize(fname)
+    except OSError:
+        return 0
+
+
+def _getmtime(fname):
+    try:
+        return os.path.getmtime(fname)
+    except OSError:
+        return None
+
+
+def deploy_all(packages, path, jobs=1, callback=None, **kwargs):
+    """Deploy each of `packages` at `path`, `jobs` at a time
+
+    Packages are independent of each other, so a failure in one
+    is reported once every other package has been deployed.
+
+    Arguments:
+        packages (list): Packages previously passed through `convert`
+        path (str): Path to install directory, e.g. "~/packages"
+        jobs (int, optional): Number of packages to deploy concurrently
+        callback (callable, optional): Called with `(package, error)` as
+            each package finishes, where `error` is None on success.
+            Always called from the calling thread.
+        **kwargs: Additional arguments passed to `deploy`
+
+    Returns:
+        failed (list): Pairs of (package, error) for each failed package
+
+    """
+
+    def _deploy_one(package):
+        try:
+            deploy(package, path=path, **kwargs)
+        except Exception as e:
+            if _log.level < logging.INFO:
+                traceback.print_exc()
+
+            return package, e
+
+        return package, None
+
+    jobs = max(1, min(jobs or 1, len(packages)))
+
+    if jobs == 1:
+        results = (_deploy_one(package) for package in packages)
+        pool = None
+    else:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(jobs)
+        results = pool.imap_unordered(_deploy_one, packages)
+
+    failed = list()
+
+    try:
+        for package, error in results:
+            if error is not None:
+                failed.append((package, error))
+
+            if callback is not None:
+                callback(package, error)
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return failed
+
+
+def convert_wheelhouse(directory, path, jobs=1, callback=None, **kwargs):
+    """Convert and deploy every wheel in `directory` at `path`, without pip
+
+    Wheels of one name and version are variants of one package, and are
+    converted together, with up to `jobs` packages converted at a time,
+    each in a process of its own. Variants already at `path` are skipped,
+    as are wheels for a platform other than that of the Python in use.
+
+    Arguments:
+        directory (str): Absolute path to directory of wheels
+        path (str): Path to install directory, e.g. "~/packages"
+        jobs (int, optional): Number of processes
+        callback (callable, optional): Called with each result as it
+            finishes, from the calling process
+        **kwargs: Additional arguments passed to `deploy`, along
+            with `zipped`, passed to `convert`
+
+    Returns:
+        results (list): Of dictionaries with "wheel", "name", "version",
+            "duration" and "status" of either "installed", "skipped",
+            "unsupported" or "failed", along with its "error"
+
+    Raises:
+        OSError: On Python, or pip telling what it supports, not found
+
+    """
+
+    from .wheelhouse import normalize
+
+    python = probe()
+
+    if not python:
+        raise OSError("Python could not be found")
+
+    if not python["tags"]:
+        raise OSError("pip could not be found, or could not tell "
+                      "which wheels %s supports" % python["executable"])
+
+    groups = collections.OrderedDict()
+
+    for fname in sorted(os.listdir(directory)):
+        if not fname.endswith(".whl"):
+            continue
+
+        name, version = fname.split("-")[:2]
+        groups.setdefault((normalize(name), version), []).append(
+            os.path.join(directory, fname))
+
+    tasks = [(fnames, path, kwargs) for fnames in groups.values()]
+    jobs = max(1, min(jobs or 1, len(tasks)))
+    initargs = (path, python["tags"])
+
+    if jobs == 1:
+        _init_converter(*initargs)
+        results = (_convert_wheels(task) for task in tasks)
+        pool = None
+    else:
+        from multiprocessing import Pool
+        pool = Pool(jobs, initializer=_init_converter, initargs=initargs)
+        results = pool.imap_unordered(_convert_wheels, tasks)
+
+    report = list()
+
+    try:
+        for results_ in results:
+            for result in results_:
+                report.append(result)
+
+                if callback is not None:
+                    callback(result)
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return report
+
+
+# State of each process of `convert_wheelhouse`
+_converter = dict()
+
+
+def _init_converter(path, tags):
+    _converter["index"] = RepositoryIndex([path])
+    _converter["tags"] = set(tags)
+
+
+def _convert_wheels(task):
+    fnames, path, kwargs = task
+    kwargs = dict(kwargs)
+    zipped = kwargs.pop("zipped", False)
+    index = _converter["index"]
+    results = list()
+    seen = set()
+
+    for fname in fnames:
+        result = {
+            "wheel": os.path.basename(fname),
+            "name": None,
+            "version": None,
+            "status": "failed",
+            "error": None,
+        }
+
+        results.append(result)
+        t0 = time.time()
 
-    """
+        try:
+            tags = _wheel_tags(fname)
 
-    assert prefix is None or isinstance(prefix, _basestring), (
-        "%s was not str" % prefix)
-    assert isinstance(names, (tuple, list)), "%s was not list or tuple" % names
+            if not any(tag.endswith("-any") for tag in tags) and (
+                    not _converter["tags"].intersection(tags)):
+                result["status"] = "unsupported"
+                continue
 
-    tempdir = tempfile.mkdtemp(suffix="-rez", prefix="pip-")
+            distribution = _read_wheel(fname)
+            result["name"] = _rez_name(distribution.project_name)
+            result["version"] = distribution.version
 
-    distributions = download(
-        names,
-        tempdir=tempdir,
-        extra_args=extra_args,
-    )
+            variant = tuple(_variants_from_distribution(distribution))
+            key = (result["name"], result["version"], variant)
 
-    packagesdir = prefix or (
-        config.release_packages_path if release
-        else config.local_packages_path
-    )
+            if key in seen or index.has_variant(*key):
+                result["status"] = "skipped"
+                continue
 
-    new, existing = list(), list()
-    for dist in distributions:
-        package = convert(dist, variants=variants)
+            seen.add(key)
 
-        if exists(package, packagesdir):
-            existing.append(package)
-        else:
-            new.append(package)
+            deploy(convert(distribution, zipped=zipped), path=path, **kwargs)
+            result["status"] = "installed"
 
-    if not new:
-        return []
+        except Exception as e:
+            if _log.level < logging.INFO:
+                traceback.print_exc()
 
-    for package in new:
-        deploy(package, path=packagesdir)
+            result["error"] = str(e)
 
-    shutil.rmtree(tempdir)
-    return new
+        finally:
+            result["duration"] = time.time() - t0
 
+    return results
 
-def download(names, tempdir=None, extra_args=None):
-    """Gather pip packages in `tempdir`
+
+def transfer_file(src, dst, mode="copy", digest=None, size=None):
+    """Bring file `src` over to `dst` using `mode`
+
+    Modes other than "copy" avoid reading and rewriting each byte, but
+    depend on what the underlying filesystems support. Whenever a mode
+    isn't supported, such as a hardlink across devices, the file is
+    copied instead.
+
+    Copies are verified against `digest` and `size` whilst being
+    written, from the same read.
 
     Arguments:
-        names (list): Names of packages to install, in pip-format,
-            e.g. ["six==1"]
-        tempdir (str, optional): Absolute path to where pip packages go until
-            they've been installed as Rez packages, defaults to the cwd
-        extra_args (list, optional): Additional arguments, typically only
-            relevant to pip rather than pipz
+        src (str): Absolute path to source file
+        dst (str): Absolute path to destination file, overwritten if exists
+        mode (str, optional): One of "copy", "hardlink", "reflink",
+            "move" or "copy_file_range". Default is "copy".
+        digest (str, optional): Expected sha256 hex digest of `src`
+        size (int, optional): Expected size of `src` in bytes
 
     Returns:
-        distributions (list): Downloaded distlib.database.InstalledDistribution
+        mode (str): The mode actually used
 
     Raises:
-        OSError: On anything gone wrong with subprocess and pip
+        IntegrityError: On a copy not matching `digest` or `size`
 
     """
 
-    extra_args = extra_args or []
-
-    assert isinstance(names, (list, tuple)), (
-        "%s was not a tuple or list" % names
-    )
-    assert all(isinstance(name, _basestring) for name in names), (
-        "%s contained non-string" % names
-    )
+    try:
+        func = _transfers[mode]
+    except KeyError:
+        raise ValueError("Unsupported transfer mode '%s'" % mode)
 
-    tempdir = tempdir or os.getcwd()
+    if mode != "copy":
+        try:
+            func(src, dst)
+            return mode
 
-    # Build pip commandline
-    cmd = [
-        "python", "-m", "pip", "install",
-        "--target", tempdir,
+        except (OSError, IOError) as e:
+            if mode not in _transfer_fallbacks:
+                _transfer_fallbacks.add(mode)
+                _log.warning("Transfer mode '%s' unsupported (%s), "
+                             "falling back to copy" % (mode, e))
 
-        # Only ever consider wheels, anything else is ancient
-        "--use-pep517",
+    if digest is None and size is None:
+        shutil.copyfile(src, dst)
+    else:
+        copy_verified(src, dst, digest=digest, size=size)
 
-        # Handle case where the Python distribution used alongside
-        # pip already has a package installed in its `site-packages/` dir.
-        "--ignore-installed",
+    return "copy"
 
-        # rez pip users don't have to see this
-        "--disable-pip-version-check",
-    ]
 
-    for extra_arg in extra_args:
-        if extra_arg in cmd:
-            print_warning("'%s' argument ignored, used internally" % extra_arg)
-            continue
-        cmd += [extra_arg]
+def copy_verified(src, dst, digest=None, size=None, chunk_size=2 ** 20):
+    """Copy `src` to `dst`, hashing each chunk on its way through
 
-    cmd += names
+    Arguments:
+        src (str): Absolute path to source file
+        dst (str): Absolute path to destination file, overwritten if exists
+        digest (str, optional): Expected sha256 hex digest of `src`
+        size (int, optional): Expected size of `src` in bytes
 
-    call(cmd)
+    Returns:
+        digest, size (tuple): Actual sha256 hex digest and size of `dst`
 
-    return sorted(
-        find_distributions(tempdir),
+    Raises:
+        IntegrityError: On `dst` not matching `digest` or `size`, in
+            which case `dst` is removed
 
-        # Upper-case characters typically come first
-        key=lambda d: d.key
-    )
+    """
 
+    with open(src, "rb") as fsrc:
+        return _copy_verified(fsrc, src, dst, digest, size, chunk_size)
 
-def exists(package, path):
-    """Does `distribution` already exists as a Rez-package in `path`?
 
-    Arguments:
-        package (rez.Package):
-        path (str): Absolute path of where to look
+def _copy_verified(fsrc, src, dst, digest, size, chunk_size=2 ** 20):
+    """Copy from file object `fsrc` named `src`, see `copy_verified`"""
+    sha = hashlib.sha256()
+    written = 0
 
-    """
+    with open(dst, "wb") as fdst:
+        for chunk in iter(lambda: fsrc.read(chunk_size), b""):
+            sha.update(chunk)
+            fdst.write(chunk)
+            written += len(chunk)
 
-    try:
-        variant = next(package.iter_variants())
-    except StopIteration:
-        return False
+    actual = sha.hexdigest()
 
-    return variant.install(path, dry_run=True) is not None
+    if (digest is not None and actual != digest) or (
+            size is not None and written != size):
+        os.remove(dst)
+        raise IntegrityError(
+            "%s did not match its RECORD, expected sha256=%s size=%s, "
+            "got sha256=%s size=%d" % (src, digest, size, actual, written)
+        )
 
+    return actual, written
 
-def convert(distribution, variants=None, dumb=False):
-    """Make a Rez package out of `distribution`
 
-    Arguments:
-        distribution (distlib.database.InstalledDistribution): Source
-        variants (list, optional): Explicitly provide variants, defaults
-            to automatically detecting the correct variants using the
-            WHEEL metadata of `distribution`.
+def _hardlink(src, dst):
+    if not hasattr(os, "link"):
+        raise OSError(errno.ENOSYS, "Hardlinks not supported")
 
-    """
+    if os.path.lexists(dst):
+        os.remove(dst)
 
-    # determine variant requirements
-    variants_ = variants or []
+    os.link(src, dst)
 
-    if not variants_:
-        WHEEL = os.path.join(distribution.egg_info, "WHEEL")
-        with open(WHEEL) as f:
-            variants_.extend(wheel_to_variants(f.read()))
 
-    requirements = _pip_to_rez_requirements(distribution)
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.ENOSYS, "Reflinks not supported")
 
-    maker = PackageMaker(_rez_name(distribution.project_name),
-                         package_cls=DeveloperPackage)
-    maker.version = distribution.version
+    # From <linux/fs.h>, _IOW(0x94, 9, int)
+    FICLONE = 0x40049409
 
-    if requirements:
-        maker.requires = requirements
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
 
-    if variants_:
-        maker.variants = [variants_]
 
-    maker.commands = '\n'.join([
-        "env.PATH.prepend('{root}/bin')",
-        "env.PYTHONPATH.prepend('{root}/python')"
-    ])
+def _move(src, dst):
+    if os.name == "nt" and os.path.exists(dst):
+        os.remove(dst)
 
-    package = maker.get_package()
-    data = maker._get_data()
-    data["pipz"] = True  # breadcrumb for preprocessing
+    os.rename(src, dst)
 
-    # preprocessing
-    result = package._get_preprocessed(data)
 
-    if result:
-        package, data = result
+def _copy_file_range(src, dst):
+    # Let the kernel copy bytes between files, without passing
+    # them through userspace. Python 3.8+ on Linux, sendfile()
+    # covers Linux 2.6.33+ on older versions of Python 3.
+    if hasattr(os, "copy_file_range"):
+        def copy(fdst, fsrc, offset, count):
+            return os.copy_file_range(fsrc, fdst, count, offset, offset)
 
-    # Store reference for deployment
-    distribution.dumb = dumb
-    _package_to_distribution[package] = distribution
+    elif hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        copy = os.sendfile
 
-    return package
+    else:
+        raise OSError(errno.ENOSYS, "copy_file_range not supported")
 
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
 
-def _dumb_files_from_distribution(dist):
-    """RECORD can split multiple PyPI packages into multiple Rez packages
+        while offset < size:
+            sent = copy(fdst.fileno(), fsrc.fileno(), offset, size - offset)
 
-    This cannot.s
+            if not sent:
+                break
 
-    """
+            offset += sent
 
-    for base, dirs, files in os.walk(dist.location):
-        for fname in files:
-            abspath = os.path.join(base, fname)
-            relpath = os.path.relpath(abspath, dist.location)
 
-            yield relpath
+def store_file(store, src, digest, mode="copy"):
+    """Add `src` to content-addressed `store` under its sha256 `digest`
 
+    Files are stored once per unique content, read-only, such that
+    one package may not modify the files of another.
 
-def _files_from_distribution(dist):
-    """(Almost) Every file of a distribution is documented in the RECORD file
+    Arguments:
+        store (str): Absolute path to root of store
+        src (str): Absolute path to file
+        digest (str): Expected sha256 hex digest of `src`
+        mode (str, optional): How to bring `src` into the store,
+            see `transfer_file`
 
-    https://www.python.org/dev/peps/pep-0427/#the-dist-info-directory
+    Returns:
+        fname (str): Absolute path to file in store, or None if the
+            content of `src` didn't match `digest`
 
     """
 
-    exclude = ["__pycache__", r"\.pyc$"]
+    fname = os.path.join(store, "sha256", digest[:2], digest)
 
-    RECORD = os.path.join(dist.egg_info, "RECORD")
-    with open(RECORD) as f:
-        for line in f:
-            relpath = line.split(",", 1)[0]
-            relpath = relpath.replace("\\", "/")
-            parts = relpath.split("/")
+    if os.path.exists(fname):
+        return fname
 
-            if any(re.findall(pat, part)
-                   for pat in exclude
-                   for part in parts):
-                continue
+    _makedirs(os.path.dirname(fname))
 
-            yield relpath
+    # Another process may be adding the same file, so write
+    # to a unique name and rename it into place once complete
+    tmp = "%s.%d.%d.tmp" % (
+        fname, os.getpid(), threading.current_thread().ident
+    )
 
+    try:
+        # Copies are verified on the way into the store,
+        # any other mode is hashed once in place
+        used = transfer_file(src, tmp, mode=mode, digest=digest)
 
-def deploy(package, path, shim="binary", as_bundle=False):
-    """Deploy `distribution` as `package` at `path`
+        if used != "copy" and _hash_file(tmp)[0] != digest:
+            if used == "move":
+                os.rename(tmp, src)
+            else:
+                os.remove(tmp)
 
-    Arguments:
-        package (rez.Package): Source package
-        path (str): Path to install directory, e.g. "~/packages"
-        shim (str): Windows-only, whether to generate binary or bat scripts.
-            Valid input is "binary" or "bat", default is "binary".
-        as_bundle (bool): Deploy packages as one bundle. No variant will be
-            installed nor returned if this is `True`.
+            raise IntegrityError("%s did not match its RECORD" % src)
 
-    """
+    except IntegrityError as e:
+        _log.warning("%s, not storing" % e)
+        return None
 
-    def _deploy(destination_root):
-        distribution = _package_to_distribution[package]
+    st = os.stat(tmp)
+    os.chmod(tmp, st.st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
 
-        # Store files from distribution for deployment
-        files = list()
+    try:
+        os.rename(tmp, fname)
+    except OSError:
+        # Windows won't rename over an existing file
+        if not os.path.exists(fname):
+            raise
 
-        if distribution.dumb:
-            for relpath in _dumb_files_from_distribution(distribution):
-                files += [(distribution.location, relpath)]
+        os.chmod(tmp, stat.S_IWRITE)
+        os.remove(tmp)
 
-        else:
-            for relpath in _files_from_distribution(distribution):
-                files += [(distribution.location, relpath)]
+    return fname
 
-        for source_root, relpath in files:
-            src = os.path.join(source_root, relpath)
-            src = os.path.normpath(src)
 
-            if not os.path.exists(src):
-                continue
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
 
-            dst = os.path.join(root, "python", relpath)
-            dst = os.path.normpath(dst)
 
-            if not os.path.exists(os.path.dirname(dst)):
-                os.makedirs(os.path.dirname(dst))
+def link_from_store(store, src, dst, digest, mode="copy"):
+    """Deploy `src` at `dst` via content-addressed `store`
 
-            shutil.copyfile(src, dst)
+    `dst` is hardlinked to the file in the store, or symlinked
+    where hardlinks aren't possible, e.g. across devices. Files
+    that can't be stored are transferred as usual.
 
-        console_scripts = find_console_scripts(distribution)
+    """
 
-        if not console_scripts:
-            return
+    fname = store_file(store, src, digest, mode=mode)
 
-        dst = os.path.join(destination_root, "bin")
-        dst = os.path.normpath(dst)
+    if fname is None:
+        return transfer_file(src, dst, mode=mode)
 
-        if not os.path.exists(dst):
-            os.makedirs(dst)
+    return _link_stored(fname, dst)
 
-        for exe, command in console_scripts.items():
-            write_console_script(dst, exe, command, shim == "binary")
 
-    if as_bundle:
-        root = path
-        variant_ = None
-    else:
-        variant = next(package.iter_variants())
-        variant_ = variant.install(path)
+def _link_stored(fname, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
 
-        root = variant_.root
+    try:
+        os.link(fname, dst)
+        return "hardlink"
+    except (OSError, AttributeError):
+        pass
 
-    if root:
-        try:
-            os.makedirs(root)
-        except OSError as e:
-            if e.errno == errno.EEXIST:
-                # That's ok
-                pass
-            else:
-                raise
+    try:
+        os.symlink(fname, dst)
+        return "symlink"
+    except (OSError, AttributeError, NotImplementedError):
+        return transfer_file(fname, dst)
 
-    with retain_cwd():
-        os.chdir(root)
-        _deploy(root)
 
-    return variant_
+_transfers = {
+    "copy": shutil.copyfile,
+    "hardlink": _hardlink,
+    "reflink": _reflink,
+    "move": _move,
+    "copy_file_range": _copy_file_range,
+}
+
+# Modes we've already warned about
+_transfer_fallbacks = set()
 
 
 def find_console_scripts(distribution):
@@ -381,19 +2739,19 @@ def find_console_scripts(distribution):
     # Specification of this file:
     #     https://packaging.python.org/specifications/
     #     entry-points/#file-format
-    fname = os.path.join(
-        distribution.egg_info,
-        "entry_points.txt"
-    )
+
+    # There may not be any entry points
+    if not distribution.has_metadata("entry_points.txt"):
+        return {}
 
     try:
         parser = CaseSensitiveConfigParser()
-        parser.read(fname)
+        fp = StringIO(distribution.get_metadata("entry_points.txt"))
 
-    # There may not be any entry points
-    except OSError as e:
-        if e.errno != errno.EEXIST:
-            raise
+        if hasattr(parser, "read_file"):
+            parser.read_file(fp)
+        else:
+            parser.readfp(fp)
 
     except Exception:
         # Any other issue, let it go
@@ -478,13 +2836,23 @@ def write_console_script(root, executable, command, binary=True):
     os.chmod(fname, st.st_mode | stat.S_IEXEC)
 
 
-def wheel_to_variants(wheel):
+def _variants_from_distribution(distribution, python=None):
+    return wheel_to_variants(
+        distribution.get_metadata("WHEEL"),
+        python=python or getattr(distribution, "python", None)
+    )
+
+
+def wheel_to_variants(wheel, python=None):
     """Parse WHEEL file of `distribution` as per PEP427
 
     https://www.python.org/dev/peps/pep-0427/#file-contents
 
     Arguments:
         wheel (str): Contents of a WHEEL file
+        python (str, optional): Version of Python the wheel was
+            downloaded for, e.g. "2.7", defaults to the version
+            of Python in use
 
     Returns:
         variants (dict): With keys {"platform", "os", "python"}
@@ -550,7 +2918,7 @@ def wheel_to_variants(wheel):
     if py["minor"]:
         # Use the actual version from the running Python
         # rather than what's coming out of the the WHEEL
-        variants["python"] = python_version()
+        variants["python"] = python or python_version()
 
     elif py["2"] and py["3"]:
         variants["python"] = None
@@ -574,6 +2942,8 @@ def wheel_to_variants(wheel):
 
 def os_name():
     """Return pip-compatible OS, e.g. windows-10.0 and Debian-7.6"""
+    from rez.utils.platform_ import platform_
+
     # pip packages are no more specific than minor/major of an os
     # E.g. windows-10.0.18362 -> windows-10.0
     try:
@@ -587,6 +2957,7 @@ def os_name():
 
 
 def platform_name():
+    from rez.utils.platform_ import platform_
     return platform_.name
 
 
@@ -594,7 +2965,6 @@ def platform_name():
 def python_version():
     """Return major.minor version of Python, prefer current context"""
 
-    import subprocess
     from rez.status import status
     context = status.context
 
@@ -612,26 +2982,12 @@ def python_version():
         raise IndexError("%s didn't have a minor version" % package.uri)
 
     # Try system Python
-    popen = subprocess.Popen(
-        """\
-        python -c "import sys;print('.'.join(map(str, sys.version_info[:2])))"
-        """,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        bufsize=10 ** 4,  # Enough to capture the version
-        shell=True,
-    )
-
-    if popen.wait() == 0:
-        version = popen.stdout.read().rstrip()
-        return version  # 3.7
+    return probe().get("python_version")  # 3.7
 
 
 @lru_cache()
 def pip_version():
     """Return version of pip"""
-    import subprocess
     from rez.status import status
     context = status.context
 
@@ -644,67 +3000,297 @@ def pip_version():
         pass
 
     # Try system Python
-    popen = subprocess.Popen(
-        "python -c \"import pip;print(pip.__version__)\"",
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        bufsize=10 ** 4,  # Enough to capture the version
-        shell=True,
-    )
+    return probe().get("pip_version")
+
+
+# Printed as JSON by the interpreter being probed, compatible with 2.7+
+_probe_script = """\
+import sys, json, sysconfig
+result = {
+    "python_version": "%d.%d" % sys.version_info[:2],
+    "version": "%d.%d.%d" % sys.version_info[:3],
+    "executable": sys.executable,
+    "platform": sysconfig.get_platform(),
+    "pip_version": None,
+    "pip_location": None,
+    "tags": [],
+}
+try:
+    import pip
+    result["pip_version"] = pip.__version__
+    result["pip_location"] = pip.__file__
+except ImportError:
+    pass
+try:
+    from pip._internal.utils.compatibility_tags import get_supported
+except ImportError:
+    try:
+        from pip._internal.pep425tags import get_supported
+    except ImportError:
+        get_supported = None
+try:
+    result["tags"] = [
+        "-".join(tag) if isinstance(tag, tuple) else str(tag)
+        for tag in get_supported()
+    ]
+except Exception:
+    pass
+sys.stdout.write(json.dumps(result))
+"""
+
+
+@lru_cache()
+def probe(python="python"):
+    """Describe `python` and its pip, in a single subprocess
+
+    Results are cached on disk per interpreter, and remain valid until
+    either the interpreter or its pip is modified, such that repeated
+    runs don't pay for starting up the interpreter. Shims are probed
+    on every run, see `pipz.cache.ProbeCache`.
+
+    Arguments:
+        python (str, optional): Name or path of interpreter,
+            defaults to whichever `python` is first on PATH
+
+    Returns:
+        result (dict): With keys "python_version" (e.g. 3.7), "version"
+            (e.g. 3.7.4), "executable", "platform", "pip_version",
+            "pip_location" and "tags", the latter being compatible wheel
+            tags in order of preference, e.g. cp37-cp37m-manylinux1_x86_64.
+            Empty if `python` could not be found.
+
+    """
+
+    executable = _which(python)
+
+    if not executable:
+        return {}
 
-    if popen.wait() == 0:
-        version = popen.stdout.read().rstrip()
-        return version
+    probes = ProbeCache(cache_root())
+    result = probes.get(executable)
 
+    if result is None:
+        with tracing.span("probe", python=executable):
+            result = _probe(executable)
 
-def call(command, **kwargs):
-    # Use logging level to determine verbosity
-    verbose = _log.level < logging.INFO
+        if result is None:
+            return {}
 
-    if isinstance(command, (tuple, list)):
-        command = " ".join(command)
+        probes.put(executable, result)
+
+    if result["tags"]:
+        result["abi"] = result["tags"][0].split("-")[1]
+        result["platform_tag"] = result["tags"][0].split("-")[2]
+
+    return result
+
+
+def _probe(executable):
+    try:
+        output = subprocess.check_output(
+            [executable, "-c", _probe_script],
+            universal_newlines=True,
+        )
+        return json.loads(output)
+
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        _log.debug("Could not probe %s: %s" % (executable, e))
+
+
+def _which(executable):
+    try:
+        from shutil import which
+    except ImportError:
+        # Python 2
+        from distutils.spawn import find_executable as which
+
+    fname = which(executable)
+    return os.path.abspath(fname) if fname else None
+
+
+def call(command, on_progress=None, max_output=200, **kwargs):
+    """Run `command`, streaming its output
+
+    Only the last `max_output` lines are kept, for the error message.
+
+    Arguments:
+        command (list): Executable and arguments, run without a shell
+        on_progress (callable, optional): Called with a dictionary per
+            line of pip output understood by `parse_progress`, plus a
+            "downloaded" event with the rate of each finished download
+        max_output (int, optional): Lines of output kept for errors
+
+    Raises:
+        OSError: On `command` returning non-zero
+
+    """
+
+    with tracing.span("pip", command=command) as attrs:
+        attrs["returncode"] = _call(command,
+                                    on_progress=on_progress,
+                                    max_output=max_output,
+                                    **kwargs)
+
+
+def _call(command, on_progress=None, max_output=200, **kwargs):
+    if isinstance(command, _basestring):
+        command = shlex.split(command, posix=os.name != "nt")
 
     popen = subprocess.Popen(
         command,
-        shell=True,
         universal_newlines=True,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         **kwargs
     )
 
-    output = list()
+    output = _Output(on_progress, max_output)
+
     for line in iter(popen.stdout.readline, ""):
+        output.feed(line)
+
+    popen.wait()
+
+    if popen.returncode != 0:
+        raise output.error(command)
+
+    return popen.returncode
+
+
+class _Output(object):
+    """Output of pip, kept in part for errors and parsed for progress"""
+
+    def __init__(self, on_progress=None, max_output=200):
+        # Use logging level to determine verbosity
+        self.verbose = _log.level < logging.INFO
+        self.on_progress = on_progress
+        self.lines = collections.deque(maxlen=max_output)
+        self.count = 0
+        self._downloading = None
 
+    def feed(self, line):
         if line.startswith("DEPRECATION"):
             # Mute warnings about Python 2 being deprecated.
             # It's out-of-band for the casual Rez user.
-            continue
+            return
 
-        output += [line.rstrip()]
+        self.lines.append(line.rstrip())
+        self.count += 1
 
-        if verbose:
+        if self.verbose:
             sys.stdout.write("# " + line)
 
-    popen.wait()
+        if self.on_progress is None:
+            return
 
-    if popen.returncode != 0:
-        command = command if isinstance(command, (list, tuple)) else [command]
-        raise OSError(
+        event = parse_progress(line)
+
+        if event is None:
+            return
+
+        event["time"] = time.time()
+
+        # A download is complete once pip moves on to something else
+        downloading = self._downloading
+        if downloading is not None:
+            duration = event["time"] - downloading["time"]
+            self.on_progress({
+                "event": "downloaded",
+                "name": downloading["name"],
+                "size": downloading["size"],
+                "duration": duration,
+                "rate": (downloading["size"] or 0) / max(duration, 1e-6),
+                "time": event["time"],
+            })
+            self._downloading = None
+
+        if event["event"] == "downloading":
+            self._downloading = event
+
+        self.on_progress(event)
+
+    def error(self, command):
+        """Return OSError for `command` having failed with this output"""
+        return OSError(
             # arg1 arg2 -------
             # Some error here
             # ------------------
             "\n".join([
                 ("%s " % " ".join(command)).ljust(70, "-"),
                 "",
-                "\n".join(output),
+                ("(last %d of %d lines)\n" % (len(self.lines), self.count)
+                 if self.count > len(self.lines) else "") +
+                "\n".join(self.lines),
                 "",
                 "-" * 70,
             ])
         )
 
 
+_progress_patterns = [
+    ("collecting", re.compile(r"^Collecting (?P<name>\S+)")),
+    ("downloading", re.compile(
+        r"^\s*Downloading (?P<name>\S+)(?: \((?P<size>[\d.]+ ?[kMG]?B)\))?"
+    )),
+    ("cached", re.compile(
+        r"^\s*Using cached (?P<name>\S+)(?: \((?P<size>[\d.]+ ?[kMG]?B)\))?"
+    )),
+    ("installing", re.compile(
+        r"^Installing collected packages: (?P<names>.+)$"
+    )),
+    ("installed", re.compile(r"^Successfully installed (?P<names>.+)$")),
+]
+
+_size_units = {"B": 1, "kB": 10 ** 3, "MB": 10 ** 6, "GB": 10 ** 9}
+
+
+def parse_progress(line):
+    """Parse a line of pip output into a progress event
+
+    Example:
+        >>> parse_progress("  Downloading six-1.12.0.whl (10 kB)")["size"]
+        10000
+
+    Returns:
+        event (dict): With key "event" being one of "collecting",
+            "downloading", "cached", "installing" or "installed",
+            along with "name" and "size" in bytes, or "names" of each
+            package being installed. None for any other line.
+
+    """
+
+    for event, pattern in _progress_patterns:
+        match = pattern.match(line.rstrip())
+
+        if match is None:
+            continue
+
+        groups = match.groupdict()
+        result = {"event": event}
+
+        if "name" in groups:
+            # Older versions of pip print the full URL
+            result["name"] = groups["name"].rsplit("/", 1)[-1]
+            result["size"] = _parse_size(groups.get("size"))
+
+        else:
+            result["names"] = [
+                name.strip() for name in groups["names"].split(",")
+            ] if event == "installing" else groups["names"].split()
+
+        return result
+
+    return None
+
+
+def _parse_size(size):
+    if not size:
+        return None
+
+    number, unit = re.match(r"([\d.]+) ?(\w+)", size).groups()
+    return int(float(number) * _size_units.get(unit, 1))
+
+
 def _rez_name(pip_name):
     return pip_name.replace("-", "_")
 
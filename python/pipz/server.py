@@ -0,0 +1,474 @@
+"""Serve installs from a long-running process, over a local socket
+
+Every `pipz install` otherwise pays for starting Python, loading the Rez
+configuration, listing package repositories and probing pip before doing
+any real work. `python -m pipz.tools serve` does all of that once, and keeps
+installing on behalf of anyone connecting to its Unix domain socket.
+
+Protocol:
+    Requests and responses are JSON, one object per line. A client sends
+    one request, and reads responses until one carries "result" or "error".
+
+    > {"command": "install", "names": ["six"], "prefix": "/packages",
+    >  "environment": {"python": "/usr/bin/python3.7", ...}}
+    < {"event": "collecting", "name": "six"}
+    < {"event": "planned", "new": [["six", "1.12.0"]], "skipped": []}
+    < {"event": "deployed", "name": "six", "version": "1.12.0", "error": null}
+    < {"result": {"installed": [["six", "1.12.0"]], "skipped": [], ...}}
+
+Concurrent requests for the same package are deployed once, with every
+other request waiting for the first to finish rather than deploying it
+again.
+
+Packages are installed with the Python and Rez configuration of the
+server, so each request carries that of its client, which must match,
+see `environment`.
+
+"""
+
+import os
+import re
+import json
+import errno
+import socket
+import shutil
+import logging
+import tempfile
+import threading
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    # Python 2
+    import SocketServer as socketserver
+
+from . import pip
+from .cache import StagingCache, cache_root
+
+_log = logging.getLogger("pipz")
+
+
+def socket_path():
+    """Return path of the socket, $PIPZ_SOCKET or within `cache_root`"""
+    return os.getenv("PIPZ_SOCKET") or os.path.join(cache_root(), "pipz.sock")
+
+
+def running(path=None):
+    """Is anyone serving at `path`?"""
+    path = path or socket_path()
+
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+    return True
+
+
+def environment():
+    """Describe what an install depends on, besides its request
+
+    Requests are installed with the Python and Rez configuration of the
+    server, so clients only forward requests to a server whose
+    environment equals their own.
+
+    Returns:
+        environment (dict): Of Python and Rez configuration, comparable
+            once sent over the socket
+
+    """
+
+    from rez.config import config
+
+    python = pip.probe()
+
+    # Settings as read from files, which $REZ_<SETTING> then overrides
+    settings = set(config._data)
+
+    return {
+        "python": os.path.realpath(python.get("executable") or ""),
+        "python_version": python.get("version"),
+        "rez_config": [
+            [fname, pip._getmtime(fname)]
+            for fname in config.sourced_filepaths
+        ],
+        "rez_environ": sorted(
+            [key, value] for key, value in os.environ.items()
+            if key.startswith("REZ_") and
+            re.sub(r"_JSON$", "", key[4:]).lower() in settings
+        ),
+    }
+
+
+def request(message, path=None, on_event=None):
+    """Send `message` to the server at `path`, and return its result
+
+    Arguments:
+        message (dict): Request, with a "command" of "install",
+            "plan" or "ping"
+        path (str, optional): Socket, defaults to `socket_path`
+        on_event (callable, optional): Called with each event
+            leading up to the result
+
+    Raises:
+        OSError: On the request failing, or the server going away
+
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path or socket_path())
+
+    try:
+        sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        stream = sock.makefile("rb")
+
+        for line in iter(stream.readline, b""):
+            response = json.loads(line.decode("utf-8"))
+
+            if "event" in response:
+                if on_event is not None:
+                    on_event(response)
+
+            elif "result" in response:
+                return response["result"]
+
+            else:
+                raise OSError(response["error"])
+
+    finally:
+        sock.close()
+
+    raise OSError("pipz server went away")
+
+
+class Server(object):
+    """Install on behalf of clients, keeping what's expensive to compute
+
+    Rez is configured and pip probed once, and repositories are indexed
+    once and revalidated on each use, see `pipz.pip.RepositoryIndex`.
+
+    Arguments:
+        jobs (int, optional): Number of requests downloaded concurrently,
+            others are queued
+
+    """
+
+    def __init__(self, jobs=4):
+        from rez.config import config
+
+        self.config = config
+        self.environment = environment()
+        self._indexes = dict()  # paths -> RepositoryIndex
+        self._inflight = dict()  # (path, name, version, variant) -> Event
+        self._lock = threading.Lock()
+        self._queue = threading.Semaphore(max(1, jobs))
+
+        # Warm up, such that the first request is as fast as any other
+        config.local_packages_path
+        pip.probe()
+        pip.python_version()
+        pip.pip_version()
+
+    def handle(self, message, send):
+        """Carry out request `message`, sending events with `send`"""
+        command = message.get("command")
+
+        if command == "ping":
+            return {"pid": os.getpid(), "environment": self.environment}
+
+        if message.get("environment") != self.environment:
+            raise ValueError("Python or Rez configuration differs from that "
+                             "of the server, install without it")
+
+        if command == "install":
+            return self.install(message, send)
+
+        if command == "plan":
+            return self.plan(message, send)
+
+        raise ValueError("Unknown command '%s'" % command)
+
+    def install(self, message, send):
+        """Install `message["names"]`, see `pipz.pip.install`"""
+        from rez.package_repository import package_repository_manager
+
+        names = message["names"]
+        packagesdir = self._packagesdir(message)
+        index = self._index([packagesdir] + message.get("paths", []))
+
+        new, skipped, waiting, failed = list(), list(), list(), list()
+
+        tempdir = tempfile.mkdtemp(suffix="-rez", prefix="pip-")
+
+        try:
+            # Only downloads are queued, such that deploying or compiling
+            # a large tree doesn't hold up requests yet to download
+            with self._queue:
+                # Rez keeps what it reads, which others may have since
+                # modified
+                with pip._rez_lock:
+                    package_repository_manager.clear_caches()
+
+                distributions = pip.download(
+                    names,
+                    tempdir=tempdir,
+                    index=message.get("index"),
+                    extra_args=message.get("extra_args"),
+                    cache=message.get("cache") and StagingCache(
+                        message["cache"],
+                        max_size=message.get("cache_size", 2048) * 10 ** 6),
+                    on_progress=send,
+                    direct=message.get("direct", False),
+                )
+
+                packages = [
+                    pip.convert(dist,
+                                variants=message.get("variants"),
+                                zipped=message.get("zip", False))
+                    for dist in distributions
+                ]
+
+            new, skipped, waiting = self._claim(packagesdir, index, packages)
+
+            send({
+                "event": "planned",
+                "new": [_describe(package) for package in new],
+                "skipped": [_describe(package) for package in skipped],
+                "waiting": [_describe(package) for package, _ in waiting],
+            })
+
+            def on_deployed(package, error):
+                send({
+                    "event": "deployed",
+                    "name": package.name,
+                    "version": str(package.version),
+                    "error": None if error is None else str(error),
+                })
+
+            failed = pip.deploy_all(new,
+                                    path=packagesdir,
+                                    jobs=message.get("jobs", 1),
+                                    callback=on_deployed,
+                                    shim=message.get("shim", "binary"),
+                                    transfer=message.get("transfer", "copy"),
+                                    store=message.get("store"))
+
+            if message.get("compile"):
+                failed_ = set(package for package, error in failed)
+                pip.compile_all([
+                    package for package in new if package not in failed_
+                ], path=packagesdir)
+
+        finally:
+            self._release(packagesdir, new)
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+        # Deployed by another request, which we've been waiting on
+        for package, event in waiting:
+            event.wait()
+
+            with self._lock:
+                exists = index.exists(package)
+
+            if exists:
+                skipped.append(package)
+            else:
+                failed.append((package, "Failed in a concurrent request"))
+
+        failed_ = set(package for package, error in failed)
+
+        return {
+            "installed": [
+                _describe(package) for package in new
+                if package not in failed_
+            ],
+            "skipped": [_describe(package) for package in skipped],
+            "failed": [
+                _describe(package) + [str(error)]
+                for package, error in failed
+            ],
+        }
+
+    def plan(self, message, send):
+        """Resolve `message["names"]` against the repository, see `pip.plan`"""
+        packagesdir = self._packagesdir(message)
+        index = self._index([packagesdir] + message.get("paths", []))
+
+        resolutions = pip.resolve(message["names"],
+                                  index=message.get("index"),
+                                  extra_args=message.get("extra_args"),
+                                  on_progress=send)
+
+        with self._lock:
+            missing, existing = pip.plan(resolutions,
+                                         index,
+                                         variants=message.get("variants"))
+
+        return {
+            "missing": [resolution.requirement for resolution in missing],
+            "existing": [
+                [resolution.name, resolution.version]
+                for resolution in existing
+            ],
+        }
+
+    def _packagesdir(self, message):
+        return os.path.abspath(message.get("prefix") or (
+            self.config.release_packages_path if message.get("release")
+            else self.config.local_packages_path
+        ))
+
+    def _index(self, paths):
+        key = tuple(os.path.abspath(path) for path in paths)
+
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = pip.RepositoryIndex(key, revalidate=True)
+
+            return self._indexes[key]
+
+    def _claim(self, packagesdir, index, packages):
+        """Divide `packages` into new, skipped and deployed elsewhere"""
+        new, skipped, waiting = list(), list(), list()
+        seen = set()
+
+        with self._lock:
+            for package in packages:
+                key = (packagesdir,) + _key(package)
+
+                if key in seen:
+                    continue
+
+                seen.add(key)
+
+                if key in self._inflight:
+                    waiting.append((package, self._inflight[key]))
+
+                elif index.exists(package):
+                    skipped.append(package)
+
+                else:
+                    self._inflight[key] = threading.Event()
+                    new.append(package)
+
+        return new, skipped, waiting
+
+    def _release(self, packagesdir, packages):
+        with self._lock:
+            for index in self._indexes.values():
+                for package in packages:
+                    index.invalidate(package.name)
+
+            for package in packages:
+                event = self._inflight.pop((packagesdir,) + _key(package))
+                event.set()
+
+
+def _key(package):
+    variant = (package.variants or [[]])[0]
+    return (package.name, str(package.version)) + tuple(
+        str(req) for req in variant)
+
+
+def _describe(package):
+    return [package.name, str(package.version)]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        closed = [False]
+
+        def send(message):
+            # The client going away shouldn't stop an install half-way
+            if closed[0]:
+                return
+
+            try:
+                self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            except (socket.error, IOError):
+                closed[0] = True
+
+        try:
+            message = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError:
+            return send({"error": "Malformed request"})
+
+        try:
+            result = self.server.pipz.handle(message, send)
+        except Exception as e:
+            if _log.level < logging.INFO:
+                traceback.print_exc()
+
+            send({"error": str(e)})
+        else:
+            send({"result": result})
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path=None, jobs=4, on_ready=None):
+    """Serve installs at `path` until interrupted
+
+    Arguments:
+        path (str, optional): Socket, defaults to `socket_path`
+        jobs (int, optional): Number of requests downloaded concurrently
+        on_ready (callable, optional): Called with the server once
+            accepting requests, e.g. to call `shutdown` from another thread
+
+    Raises:
+        OSError: On already serving at `path`
+
+    """
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix domain sockets are unsupported on this platform")
+
+    path = os.path.abspath(path or socket_path())
+
+    if running(path):
+        raise OSError("Already serving at %s" % path)
+
+    try:
+        # Left behind by a server that wasn't shut down
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    # Requests install as whoever is serving, so only they may connect
+    umask = os.umask(0o177)
+
+    try:
+        server = _UnixServer(path, _Handler)
+    finally:
+        os.umask(umask)
+
+    server.pipz = Server(jobs=jobs)
+
+    try:
+        if on_ready is not None:
+            on_ready(server)
+
+        server.serve_forever()
+
+    finally:
+        server.server_close()
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
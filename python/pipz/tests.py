@@ -2,9 +2,14 @@
 test rez pip
 """
 import os
+import gc
+import sys
+import json
 import stat
 import shutil
+import zipfile
 import tempfile
+import threading
 import subprocess
 
 from rez.tests.util import TempdirMixin, TestBase
@@ -13,7 +18,8 @@ from rez.package_maker__ import make_package
 from rez.packages_ import iter_packages
 from rez.util import which
 
-from . import pip
+from . import pip, wheelhouse, tracing, benchmark, server, manifest
+from .cache import StagingCache, ProbeCache
 
 
 def rmtree(path):
@@ -79,6 +85,27 @@ class TestWheel(TestBase, TempdirMixin):
     def _installed_packages(self, name):
         return list(iter_packages(name, paths=[self.temprepo]))
 
+    def _make_wheels(self, *names, **kwargs):
+        """Write a wheel of each of `names` into {temprepo}/wheels
+
+        Arguments:
+            **kwargs: Passed to `pipz.benchmark.make_wheel`
+
+        Returns:
+            wheels (str): Absolute path to directory of wheels
+
+        """
+
+        wheels = os.path.join(self.temprepo, "wheels")
+
+        if not os.path.isdir(wheels):
+            os.makedirs(wheels)
+
+        for name in names:
+            benchmark.make_wheel(wheels, name, **kwargs)
+
+        return wheels
+
     def _test_install(self, package, version):
         installed = self._install("%s==%s" % (package, version))
         assert installed, "Something should have been installed"
@@ -151,6 +178,860 @@ I am b'a'd
 
         self.assertRaises(Exception, pip.wheel_to_variants, WHEEL)
 
+    def test_transfer_modes(self):
+        """Every transfer mode produces an identical file"""
+        for mode in ("copy", "hardlink", "reflink", "move", "copy_file_range"):
+            src = os.path.join(self.temprepo, "%s.src" % mode)
+            dst = os.path.join(self.temprepo, "%s.dst" % mode)
+
+            with open(src, "wb") as f:
+                f.write(b"Hello World" * 1000)
+
+            pip.transfer_file(src, dst, mode=mode)
+
+            with open(dst, "rb") as f:
+                self.assertEqual(f.read(), b"Hello World" * 1000)
+
+        self.assertRaises(ValueError, pip.transfer_file, dst, src, "teleport")
+
+    def test_store(self):
+        """Packages share identical files via the store"""
+        store = os.path.join(self.temprepo, ".store")
+        self._install("six==1.12.0", variants=["python-2"], store=store)
+        self._install("six==1.12.0", variants=["python-3"], store=store)
+
+        package = self._installed_packages("six")[0]
+        fnames = [
+            os.path.join(variant.root, "python", "six.py")
+            for variant in package.iter_variants()
+        ]
+
+        self.assertEqual(len(fnames), 2)
+        self.assertTrue(os.path.samefile(*fnames))
+
+    def test_copy_verified(self):
+        """Copies are verified against RECORD"""
+        src = os.path.join(self.temprepo, "src")
+        dst = os.path.join(self.temprepo, "dst")
+
+        with open(src, "wb") as f:
+            f.write(b"Hello World")
+
+        digest, size = pip.copy_verified(src, dst)
+        self.assertEqual(size, 11)
+        self.assertEqual(pip.copy_verified(src, dst, digest, size),
+                         (digest, size))
+
+        self.assertRaises(pip.IntegrityError,
+                          pip.copy_verified, src, dst, digest, 12)
+        self.assertRaises(pip.IntegrityError,
+                          pip.copy_verified, src, dst, "abc", size)
+        self.assertFalse(os.path.exists(dst))
+
+    def test_integrity(self):
+        """Files not matching RECORD fail their package, unless shared"""
+        wheels = self._make_wheels("corruptwheel", files=1)
+
+        dist, = pip.download(["corruptwheel"],
+                             tempdir=os.path.join(self.temprepo, "staging"),
+                             index=wheels)
+
+        module = os.path.join(dist.location, "corruptwheel", "sub0",
+                              "module0.py")
+
+        with open(module, "w") as f:
+            f.write("x = 2\n")
+
+        package = pip.convert(dist)
+        self.assertRaises(pip.IntegrityError,
+                          pip.deploy, package, path=self.temprepo)
+        self.assertEqual(self._installed_packages("corruptwheel"), [])
+
+        # E.g. both distributions carry a tests/__init__.py
+        other = os.path.join(dist.location, "other-1.0.dist-info")
+        os.makedirs(other)
+
+        with open(os.path.join(other, "RECORD"), "w") as f:
+            f.write("corruptwheel/sub0/module0.py,,\n")
+
+        pip.deploy(package, path=self.temprepo)
+        self.assertEqual(len(self._installed_packages("corruptwheel")), 1)
+
+    def test_direct(self):
+        """Wheels are extracted directly, equal to going through pip"""
+        wheels = self._make_wheels("directwheel",
+                                   files=5,
+                                   entry_points=True,
+                                   requires=["six>=1.0"])
+
+        roots = list()
+
+        for direct in (False, True):
+            prefix = os.path.join(self.temprepo, "direct-%s" % direct)
+            staging = os.path.join(self.temprepo, "staging-%s" % direct)
+            os.makedirs(staging)
+
+            dist, = pip.download(["directwheel"],
+                                 tempdir=staging,
+                                 index=wheels,
+                                 extra_args=["--no-deps"],
+                                 direct=direct)
+
+            package = pip.convert(dist)
+            self.assertEqual(package.requires[0].name, "six")
+
+            variant = pip.deploy(package, path=prefix)
+            roots.append(variant.root)
+
+        def listing(root):
+            return sorted(
+                os.path.relpath(os.path.join(base, fname), root)
+                for base, dirs, fnames in os.walk(root)
+                for fname in fnames
+
+                # Written by pip alone
+                if fname not in ("INSTALLER", "REQUESTED", "direct_url.json")
+            )
+
+        self.assertEqual(listing(roots[0]), listing(roots[1]))
+        self.assertIn(os.path.join("bin", "directwheel"), listing(roots[1]))
+
+        # Dumb packages deploy every file, rather than those of RECORD
+        for direct in (False, True):
+            prefix = os.path.join(self.temprepo, "dumb-%s" % direct)
+            dist, = pip.download(["directwheel"],
+                                 tempdir=os.path.join(self.temprepo,
+                                                      "dumb-staging-%s"
+                                                      % direct),
+                                 index=wheels,
+                                 extra_args=["--no-deps"],
+                                 direct=direct)
+
+            package = pip.convert(dist, dumb=True)
+            variant = pip.deploy(package, path=prefix)
+            self.assertIn(os.path.join("python", "directwheel", "sub0",
+                                       "module0.py"),
+                          listing(variant.root))
+
+        # Failed downloads leave nothing behind
+        tmp = os.path.join(self.temprepo, "tmp")
+        os.makedirs(tmp)
+        self.addCleanup(setattr, tempfile, "tempdir", tempfile.tempdir)
+        tempfile.tempdir = tmp
+
+        self.assertRaises(OSError, self._install, "missingwheel",
+                          index=wheels, direct=True)
+        self.assertEqual(os.listdir(tmp), [])
+
+        self.assertEqual(pip._wheel_destination(
+            "six-1.0.data/scripts/six", "six-1.0.data/"), "bin/six")
+        self.assertEqual(pip._wheel_destination(
+            "six-1.0.data/platlib/six.py", "six-1.0.data/"), "python/six.py")
+
+    def test_requirements(self):
+        """Groups of requirements share dependencies, downloaded once"""
+        wheels = self._make_wheels("groupa", "groupb",
+                                   requires=["groupshared"])
+        self._make_wheels("groupshared")
+
+        base = os.path.join(self.temprepo, "base.txt")
+        with open(base, "w") as f:
+            f.write("groupb \\\n  >=1.0 --hash=sha256:abc\n")
+
+        manifest = os.path.join(self.temprepo, "requirements.txt")
+        with open(manifest, "w") as f:
+            f.write("\n".join([
+                "# Pinned",
+                "groupa==1.0  # first",
+                "-r base.txt",
+                "--find-links wheels",
+                "--no-index",
+            ]))
+
+        names, options = pip.read_requirements(manifest)
+        self.assertEqual(names, ["groupa==1.0", "groupb >=1.0"])
+        self.assertEqual(options, ["--find-links", wheels, "--no-index"])
+
+        groups = pip.split_requirements(names, 4)
+        self.assertEqual(groups, [["groupa==1.0"], ["groupb >=1.0"]])
+
+        distributions = pip.download_all(
+            groups,
+            tempdir=os.path.join(self.temprepo, "staging"),
+            jobs=2,
+            extra_args=options,
+        )
+
+        self.assertEqual([dist.key for dist in distributions],
+                         ["groupa", "groupb", "groupshared"])
+
+        # A pin in one group applies to dependencies of every other
+        self._make_wheels("groupshared", version="2.0")
+        self._make_wheels("groupc", requires=["groupshared<2"])
+
+        distributions = pip.download_all(
+            [["groupa"], ["groupshared==1.0"]],
+            tempdir=os.path.join(self.temprepo, "pinned"),
+            jobs=2,
+            extra_args=options,
+        )
+
+        self.assertEqual(
+            [(dist.key, dist.version) for dist in distributions],
+            [("groupa", "1.0"), ("groupshared", "1.0")])
+
+        # Whereas dependencies pinned by neither group may differ
+        self.assertRaises(OSError, pip.download_all,
+                          [["groupa"], ["groupc"]],
+                          tempdir=os.path.join(self.temprepo, "conflict"),
+                          extra_args=options)
+
+    def test_compile(self):
+        """Packages are compiled once deployed, with hash-based pycs"""
+        wheels = self._make_wheels("compiledwheel", files=3)
+
+        self._install("compiledwheel",
+                      index=wheels,
+                      extra_args=["--no-deps"],
+                      compile=True)
+
+        sub0 = os.path.join(self.temprepo, "compiledwheel", "1.0",
+                            "python", "compiledwheel", "sub0")
+        version = pip.version_tuple(pip.probe()["python_version"])
+
+        pycache = os.path.join(sub0, "__pycache__")
+
+        # Python 2 writes bytecode alongside its source
+        if version < (3,):
+            pycache = sub0
+
+        pycs = [fname for fname in os.listdir(pycache)
+                if fname.endswith(".pyc")]
+
+        self.assertEqual(len(pycs), 4, pycs)
+
+        if version >= (3, 7):
+            with open(os.path.join(pycache, pycs[0]), "rb") as f:
+                f.read(4)  # magic
+
+                # PEP 552, checked hash-based
+                flags = f.read(4)
+
+            self.assertEqual(flags[0], 3)
+
+    def test_zipped(self):
+        """Pure-Python packages are deployed as an importable python.zip"""
+        wheels = self._make_wheels("zippedwheel", files=3)
+        self._make_wheels("nativewheel", purelib=False)
+
+        installed = self._install("zippedwheel", "nativewheel",
+                                  index=wheels,
+                                  extra_args=["--no-deps"],
+                                  direct=True,
+                                  zipped=True)
+
+        roots = dict(
+            (package.name, os.path.join(self.temprepo, package.name, "1.0"))
+            for package in installed
+        )
+
+        zipped = os.path.join(roots["zippedwheel"], "python.zip")
+        self.assertTrue(os.path.isfile(zipped))
+        self.assertFalse(os.path.exists(
+            os.path.join(roots["zippedwheel"], "python")))
+
+        subprocess.check_call(
+            [sys.executable, "-c", "import zippedwheel.sub0.module2"],
+            env=dict(os.environ, PYTHONPATH=zipped),
+        )
+
+        # Native extensions remain a directory
+        commands = dict(
+            (package.name, str(package.commands)) for package in installed
+        )
+
+        self.assertIn("{root}/python.zip", commands["zippedwheel"])
+        self.assertNotIn("python.zip", commands["nativewheel"])
+
+        # The same files make the same archive, whatever their umask
+        source = os.path.join(self.temprepo, "source")
+        os.makedirs(source)
+
+        archives = list()
+
+        for mode in (0o600, 0o664):
+            fname = os.path.join(source, "module.py")
+
+            with open(fname, "w") as f:
+                f.write("x = 1\n")
+
+            os.chmod(fname, mode)
+            archive = os.path.join(self.temprepo, "%o.zip" % mode)
+            pip.zip_directory(source, archive)
+
+            with open(archive, "rb") as f:
+                archives.append(f.read())
+
+        self.assertEqual(archives[0], archives[1])
+
+    def test_install_memory(self):
+        """Repeated installs don't keep packages or distributions alive"""
+        from rez.developer_package import DeveloperPackage
+        from pkg_resources import Distribution
+
+        wheels = self._make_wheels("memorywheel")
+
+        def install(index):
+            pip.install(["memorywheel"],
+                        prefix=os.path.join(self.temprepo, "repo%d" % index),
+                        index=wheels,
+                        extra_args=["--no-deps"],
+                        direct=True)
+
+        def alive():
+            gc.collect()
+            return sum(
+                isinstance(obj, DeveloperPackage) or (
+                    isinstance(obj, Distribution) and
+                    obj.project_name == "memorywheel")
+                for obj in gc.get_objects()
+            )
+
+        install(0)
+        before = alive()
+
+        for index in range(1, 11):
+            install(index)
+
+        self.assertLessEqual(alive(), before)
+
+    def test_serve(self):
+        """Installs are served over a socket, concurrent requests deduplicated"""
+        wheels = self._make_wheels("servedwheel")
+
+        path = os.path.join(self.temprepo, "pipz.sock")
+        ready = threading.Event()
+        servers = list()
+
+        def on_ready(server_):
+            servers.append(server_)
+            ready.set()
+
+        thread = threading.Thread(target=server.serve,
+                                  args=(path,),
+                                  kwargs={"jobs": 2, "on_ready": on_ready})
+        thread.daemon = True
+        thread.start()
+
+        self.assertTrue(ready.wait(30))
+        self.addCleanup(servers[0].shutdown)
+        self.assertTrue(server.running(path))
+
+        results = list()
+        message = {
+            "command": "install",
+            "environment": server.environment(),
+            "names": ["servedwheel"],
+            "prefix": self.temprepo,
+            "index": wheels,
+            "extra_args": ["--no-deps"],
+        }
+
+        pong = server.request({"command": "ping"}, path=path)
+        self.assertEqual(pong["environment"], message["environment"])
+
+        # Deploying holds no place in the queue of downloads
+        queued = list()
+        deploy_all = pip.deploy_all
+
+        def deploy_all_(*args, **kwargs):
+            queue = servers[0].pipz._queue
+            queued.append(queue.acquire(False))
+
+            if queued[-1]:
+                queue.release()
+
+            return deploy_all(*args, **kwargs)
+
+        pip.deploy_all = deploy_all_
+        self.addCleanup(setattr, pip, "deploy_all", deploy_all)
+
+        def install():
+            results.append(server.request(message, path=path))
+
+        threads = [threading.Thread(target=install) for _ in range(2)]
+        for thread_ in threads:
+            thread_.start()
+        for thread_ in threads:
+            thread_.join()
+
+        self.assertEqual(sorted(
+            len(result["installed"]) for result in results), [0, 1])
+        self.assertEqual(len(self._installed_packages("servedwheel")), 1)
+        self.assertTrue(queued and all(queued))
+
+        with self.assertRaises(OSError):
+            server.request({"command": "unknown"}, path=path)
+
+        # Installed with the server's Python, rather than the client's
+        other = dict(message, environment=dict(message["environment"],
+                                               python="/usr/bin/python2"))
+        with self.assertRaises(OSError):
+            server.request(other, path=path)
+
+    def test_install_async(self):
+        """Many installs are driven from one event loop"""
+        if sys.version_info < (3, 5):
+            self.skipTest("asyncio API requires Python 3.5+")
+
+        import asyncio
+        from . import aio
+
+        names = ["asyncwheel%d" % index for index in range(3)]
+        wheels = self._make_wheels(*names)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(loop.close)
+
+        semaphore = asyncio.Semaphore(2)
+        events = list()
+
+        results = loop.run_until_complete(asyncio.gather(*(
+            aio.install_async([name],
+                              prefix=self.temprepo,
+                              index=wheels,
+                              extra_args=["--no-deps"],
+                              on_progress=events.append,
+                              semaphore=semaphore)
+            for name in names
+        )))
+
+        self.assertEqual([[p.name for p in result] for result in results],
+                         [[name] for name in names])
+        self.assertIn("installed", [event["event"] for event in events])
+
+        for name in names:
+            self.assertEqual(len(self._installed_packages(name)), 1)
+
+        with self.assertRaises(OSError):
+            loop.run_until_complete(aio.call_async(
+                [sys.executable, "-c", "import sys; sys.exit(1)"]))
+
+    def test_repair(self):
+        """Damaged files are found via the manifest, and only those restored"""
+        wheels = self._make_wheels("repairedwheel", entry_points=True)
+
+        self._install("repairedwheel", index=wheels, extra_args=["--no-deps"])
+
+        root = os.path.join(self.temprepo, "repairedwheel", "1.0")
+        python = os.path.join(root, "python", "repairedwheel", "sub0")
+
+        self.assertEqual(list(manifest.find(self.temprepo)), [root])
+        self.assertEqual(manifest.verify(root), [])
+
+        # Modified time alone isn't damage
+        os.utime(os.path.join(python, "module1.py"), (0, 0))
+
+        os.remove(os.path.join(python, "module2.py"))
+        with open(os.path.join(python, "module3.py"), "r+b") as f:
+            f.write(b"!")
+
+        damaged = [
+            ("python/repairedwheel/sub0/module2.py", "missing"),
+            ("python/repairedwheel/sub0/module3.py", "modified"),
+        ]
+
+        self.assertEqual(sorted(manifest.verify(root)), damaged)
+        self.assertEqual(sorted(pip.repair(root, index=wheels)),
+                         [relpath for relpath, reason in damaged])
+        self.assertEqual(manifest.verify(root), [])
+
+    def test_convert_wheelhouse(self):
+        """Every wheel of a directory is installed, across processes"""
+        for version in ("1.0", "2.0"):
+            wheels = self._make_wheels("bulkwheel", "otherwheel",
+                                       version=version)
+
+        fname = benchmark.make_wheel(wheels, "foreignwheel")
+        os.rename(fname, os.path.join(
+            wheels, "foreignwheel-1.0-cp99-cp99-win_foo.whl"))
+
+        results = pip.convert_wheelhouse(wheels, self.temprepo, jobs=2)
+        statuses = dict((r["wheel"], r["status"]) for r in results)
+
+        self.assertEqual(sorted(statuses.values()),
+                         ["installed"] * 4 + ["unsupported"])
+        self.assertEqual(len(self._installed_packages("bulkwheel")), 2)
+
+        results = pip.convert_wheelhouse(wheels, self.temprepo)
+        self.assertEqual(sorted(r["status"] for r in results),
+                         ["skipped"] * 4 + ["unsupported"])
+
+        # Without Python, nothing tells which wheels are supported
+        PATH = os.environ["PATH"]
+        os.environ["PATH"] = wheels
+        pip.probe.cache_clear()
+
+        try:
+            self.assertRaises(OSError,
+                              pip.convert_wheelhouse, wheels, self.temprepo)
+        finally:
+            os.environ["PATH"] = PATH
+            pip.probe.cache_clear()
+
+    def test_zip_slip(self):
+        """Wheel members outside of the package fail it, unwritten"""
+        wheels = self._make_wheels()
+        fname = benchmark.make_wheel(wheels, "slipwheel")
+
+        escape = "../" * 32 + "tmp/pipz-zipslip-%d" % os.getpid()
+        target = os.path.join("/tmp", os.path.basename(escape))
+
+        with zipfile.ZipFile(fname) as whl:
+            members = [(name, whl.read(name)) for name in whl.namelist()]
+
+        with zipfile.ZipFile(fname, "w") as whl:
+            for name, data in members:
+                if name.endswith("RECORD"):
+                    data += ("%s,,\n" % escape).encode("utf-8")
+                whl.writestr(name, data)
+
+            whl.writestr(escape, b"owned\n")
+
+        try:
+            result, = pip.convert_wheelhouse(wheels, self.temprepo)
+            self.assertFalse(os.path.exists(target))
+
+        finally:
+            if os.path.exists(target):
+                os.remove(target)
+
+        self.assertEqual(result["status"], "failed")
+        self.assertIn("outside of the package", result["error"])
+        self.assertEqual(self._installed_packages("slipwheel"), [])
+
+    def test_pythons(self):
+        """Download for multiple versions of Python, sharing pure-Python"""
+        wheels = self._make_wheels("targetwheel")
+
+        distributions = pip.download_all(
+            [["targetwheel"]],
+            tempdir=os.path.join(self.temprepo, "staging"),
+            jobs=2,
+            pythons=["2.7", "3.6"],
+            index=wheels,
+        )
+
+        self.assertEqual(len(distributions), 1)
+        self.assertIn(distributions[0].python, ("2.7", "3.6"))
+
+        WHEEL = "Wheel-Version: 1.0\nTag: cp27-cp27mu-manylinux1_x86_64\n"
+        variants = pip.wheel_to_variants(WHEEL, python="2.7")
+        self.assertEqual(variants[-1], "python-2.7")
+
+    def test_atomic_deploy(self):
+        """Packages are published once complete, leftovers removed"""
+        wheels = self._make_wheels("atomicwheel")
+        repo = os.path.join(self.temprepo, "repo")
+
+        stale = os.path.join(repo, ".pipz-staging", "otherhost-123-abc")
+        recent = os.path.join(repo, ".pipz-staging", "otherhost-456-def")
+        os.makedirs(stale)
+        os.makedirs(recent)
+        os.utime(stale, (0, 0))
+
+        dist, = pip.download(["atomicwheel"], tempdir=self.temprepo,
+                             index=wheels)
+        package = pip.convert(dist)
+
+        # Once, and once more over the now existing package
+        for attempt in range(2):
+            variant = pip.deploy(package, path=repo)
+
+            self.assertTrue(os.path.exists(
+                os.path.join(variant.root, "package.py")))
+            self.assertTrue(os.path.exists(
+                os.path.join(variant.root, "python", "atomicwheel")))
+
+        self.assertEqual(os.listdir(os.path.join(repo, ".pipz-staging")),
+                         ["otherhost-456-def"])
+        self.assertEqual(pip.clean_staging(repo, max_age=0), [recent])
+
+    def test_distribution_size(self):
+        """Size is known from RECORD, equal to what's deployed"""
+        wheels = self._make_wheels("sizedwheel", files=20, file_size=500)
+
+        for direct in (False, True):
+            staging = os.path.join(self.temprepo, "staging-%s" % direct)
+            os.makedirs(staging)
+
+            dist, = pip.download(["sizedwheel"],
+                                 tempdir=staging,
+                                 index=wheels,
+                                 direct=direct)
+
+            package = pip.convert(dist)
+            root = pip.deploy(package, path=os.path.join(
+                self.temprepo, "repo-%s" % direct)).root
+
+            deployed = sum(
+                os.path.getsize(os.path.join(base, fname))
+                for base, dirs, fnames in os.walk(os.path.join(root, "python"))
+                for fname in fnames
+            )
+
+            self.assertGreater(pip.distribution_size(dist), 20 * 500)
+            self.assertEqual(pip.distribution_size(dist), deployed)
+
+    def test_plan(self):
+        """Only what's missing from the repository is planned for download"""
+        wheels = self._make_wheels()
+        fname = benchmark.make_wheel(wheels, "plannedwheel")
+
+        self._install("plannedwheel", index=wheels, extra_args=["--no-deps"])
+
+        def item(name, url, is_direct=False):
+            return {
+                "metadata": {"name": name, "version": "1.0"},
+                "download_info": {"url": url},
+                "is_direct": is_direct,
+            }
+
+        resolutions = pip._read_report({"install": [
+            item("plannedwheel", "https://host/%s#sha256=abc"
+                 % os.path.basename(fname)),
+            item("Other.Wheel", "https://host/Other.Wheel-1.0-py3-none-any.whl"),
+            item("sdist", "file:///sdist-1.0", is_direct=True),
+        ]})
+
+        missing, existing = pip.plan(resolutions,
+                                     pip.RepositoryIndex([self.temprepo]))
+
+        self.assertEqual([r.name for r in existing], ["plannedwheel"])
+        self.assertEqual([r.requirement for r in missing], [
+            "Other.Wheel==1.0", "sdist @ file:///sdist-1.0"
+        ])
+        self.assertEqual(missing[0].name, "Other.Wheel")
+        self.assertEqual(missing[0].variants, [["python-3"]])
+        self.assertFalse(missing[1].known)
+
+        # Packages installed with --variant are of that variant alone
+        resolutions = pip._read_report({"install": [
+            item("plannedwheel", "https://host/%s" % os.path.basename(fname)),
+        ]})
+
+        missing, existing = pip.plan(resolutions,
+                                     pip.RepositoryIndex([self.temprepo]),
+                                     variants=["python-2"])
+
+        self.assertEqual([r.name for r in missing], ["plannedwheel"])
+        self.assertEqual(missing[0].variants, [["python-2"]])
+
+        self.assertLess(pip.version_tuple("22.0.4"), (22, 2))
+        self.assertGreater(pip.version_tuple("22.10"), (22, 2))
+
+    def test_staging_cache(self):
+        """Staged packages are reused, least recently used evicted"""
+        cache = StagingCache(self.temprepo, max_size=15)
+
+        key = cache.key(["Six == 1.12", "pyyaml"], [], "3.7", "19.0", "")
+        self.assertEqual(key, cache.key(["pyyaml", "six==1.12"],
+                                        [], "3.7", "19.0", ""))
+        self.assertNotEqual(key, cache.key(["pyyaml", "six==1.12"],
+                                           [], "2.7", "19.0", ""))
+
+        for key in ("a", "b"):
+            tempdir = cache.tempdir(key)
+
+            with open(os.path.join(tempdir, "file"), "wb") as f:
+                f.write(b"0123456789")
+
+            self.assertEqual(cache.put(key, tempdir),
+                             os.path.join(cache.root, key))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+
+        # Left by a download that was killed, and one still in progress
+        orphan = cache.tempdir("c")
+        os.utime(orphan, (0, 0))
+        current = cache.tempdir("d")
+
+        cache.put("e", cache.tempdir("e"))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(current))
+
+    def test_wheelhouse(self):
+        """Build a PEP 503 index from a directory of wheels"""
+        fname = os.path.join(self.temprepo, "My_Project-1.0-py3-none-any.whl")
+
+        with zipfile.ZipFile(fname, "w") as whl:
+            whl.writestr("My_Project-1.0.dist-info/METADATA", "\n".join([
+                "Metadata-Version: 2.1",
+                "Name: My_Project",
+                "Version: 1.0",
+                "Requires-Python: >=3.6",
+            ]))
+
+        projects = wheelhouse.build(self.temprepo)
+        self.assertEqual(projects, {"my-project": [os.path.basename(fname)]})
+
+        with open(os.path.join(self.temprepo, "simple", "index.html")) as f:
+            self.assertIn('href="my-project/"', f.read())
+
+        project = os.path.join(self.temprepo, "simple", "my-project")
+        with open(os.path.join(project, "index.html")) as f:
+            html = f.read()
+
+        self.assertIn('href="../../My_Project-1.0-py3-none-any.whl#sha256=',
+                      html)
+        self.assertIn('data-requires-python="&gt;=3.6"', html)
+
+        # pip reads the index, until out of date with its directory
+        self.assertEqual(pip._index_args(self.temprepo)[:2],
+                         ["--isolated", "--index-url"])
+
+        os.utime(self.temprepo, (0, 2 ** 31))
+        self.assertEqual(pip._index_args(self.temprepo)[0], "--no-index")
+
+    def test_tools(self):
+        """Packages may share their name with a command of pipz.tools"""
+        wheels = self._make_wheels("serve")
+
+        pythondir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=pythondir)
+
+        with open(os.devnull, "w") as devnull:
+            for args in (["pipz.tools", "wheelhouse", "build", wheels],
+                         ["pipz", "serve",
+                          "--wheelhouse", wheels,
+                          "--prefix", self.temprepo,
+                          "--yes", "--no-server"]):
+                subprocess.check_call([sys.executable, "-m"] + args,
+                                      env=env,
+                                      stdout=devnull)
+
+        self.assertEqual(len(self._installed_packages("serve")), 1)
+
+    def test_probe(self):
+        """Interpreters are probed once, and cached on disk"""
+        result = pip.probe()
+        self.assertEqual(result["python_version"], pip.python_version())
+        self.assertEqual(result["pip_version"], pip.pip_version())
+
+        probes = ProbeCache(self.temprepo)
+        self.assertIsNone(probes.get(result["executable"]))
+
+        probes.put(result["executable"], result)
+        self.assertEqual(probes.get(result["executable"]), result)
+
+        # E.g. pyenv, running whichever Python $PYENV_VERSION says
+        shim = os.path.join(self.temprepo, "python")
+
+        with open(shim, "w") as f:
+            f.write("#!/bin/sh\nexec %s \"$@\"\n" % result["executable"])
+
+        os.chmod(shim, 0o755)
+        probes.put(shim, pip._probe(shim))
+        self.assertIsNone(probes.get(shim))
+
+    def test_import_time(self):
+        """Importing the command-line interface is cheap"""
+        script = "\n".join([
+            "import sys, json",
+            "import pipz.cli",
+            "print(json.dumps(sorted(sys.modules)))",
+        ])
+
+        pythondir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output(
+            [sys.executable, "-c", script],
+            env=dict(os.environ, PYTHONPATH=pythondir),
+            universal_newlines=True,
+        )
+
+        modules = json.loads(output.splitlines()[-1])
+
+        for module in ("pkg_resources",
+                       "rez.config",
+                       "rez.package_maker__",
+                       "rez.developer_package",
+                       "rez.packages_"):
+            self.assertNotIn(module, modules)
+
+    def test_trace(self):
+        """Spans are written as JSON lines"""
+        fname = os.path.join(self.temprepo, "trace.jsonl")
+        tracing.start(fname)
+
+        try:
+            with tracing.span("deploy", package="six") as attrs:
+                attrs["files"] = 3
+
+            with tracing.span("pip"):
+                pass
+
+        finally:
+            tracing.stop()
+
+        with open(fname) as f:
+            spans = [json.loads(line) for line in f]
+
+        self.assertEqual([span["name"] for span in spans], ["deploy", "pip"])
+        self.assertEqual(spans[0]["package"], "six")
+        self.assertEqual(spans[0]["files"], 3)
+        self.assertGreaterEqual(spans[0]["duration"], 0)
+
+    def test_benchmark(self):
+        """Benchmark every stage offline, with synthetic wheels"""
+        results = benchmark.run(sizes=[10], repeat=1, tempdir=self.temprepo)
+        stages = set(result["stage"] for result in results["results"])
+        cases = set(result["case"] for result in results["results"])
+
+        self.assertEqual(stages, set([
+            "download",
+            "convert",
+            "_pip_to_rez_requirements",
+            "wheel_to_variants",
+            "deploy",
+            "exists",
+        ]))
+        self.assertEqual(len(cases), 4)
+        self.assertEqual(benchmark.compare(results, results), [])
+
+    def test_progress(self):
+        """pip output is streamed as progress, and bounded on error"""
+        script = "\n".join([
+            "import sys",
+            "print('Collecting six')",
+            "print('  Downloading six-1.12.0-py2.py3-none-any.whl (10 kB)')",
+            "print('Installing collected packages: six')",
+            "for i in range(500): print('line %d' % i)",
+            "sys.exit(1)",
+        ])
+
+        events = list()
+
+        with self.assertRaises(OSError) as cm:
+            pip.call([sys.executable, "-c", script],
+                     on_progress=events.append,
+                     max_output=10)
+
+        self.assertEqual([e["event"] for e in events], [
+            "collecting", "downloading", "downloaded", "installing"
+        ])
+        self.assertEqual(events[2]["size"], 10000)
+        self.assertIn("line 499", str(cm.exception))
+        self.assertNotIn("line 489", str(cm.exception))
+        self.assertEqual(pip.parse_progress(
+            "Downloading https://host/PyYAML-5.1.tar.gz (1.2MB)"), {
+            "event": "downloading",
+            "name": "PyYAML-5.1.tar.gz",
+            "size": 1200000,
+        })
+
     def test_purepython_23(self):
         """Install a pure-Python package compatible with both Python 2 and 3"""
         self._test_install("six", "1.12.0")
@@ -194,6 +1075,17 @@ I am b'a'd
         for req in package.requires:
             self.assertIn(req.name.lower(), names)
 
+    def test_parallel_deploy(self):
+        """Deploy multiple packages concurrently"""
+        installed = self._install("six", "click", "markupsafe", jobs=3)
+        names = [pkg.name.lower() for pkg in installed]
+
+        for name in ("click", "markupsafe", "six"):
+            self.assertIn(name, names)
+
+        for package in installed:
+            self.assertEqual(len(self._installed_packages(package.name)), 1)
+
     def test_override_variant(self):
         """Test overriding variant"""
         installed = self._install("six", variants=["python-2"])
@@ -201,6 +1093,28 @@ I am b'a'd
         package = installed[0].variants[0][0]
         self.assertEqual(str(package), "python-2")
 
+    def test_exists_all(self):
+        """Existing packages are found via an index of the repository"""
+        self._install("six==1.12.0", variants=["python-2"])
+
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(rmtree, tempdir)
+
+        distributions = pip.download(["six==1.12.0"], tempdir=tempdir)
+        packages = [
+            pip.convert(distributions[0], variants=["python-2"]),
+            pip.convert(distributions[0], variants=["python-3"]),
+        ]
+
+        self.assertEqual(pip.exists_all(packages, [self.temprepo]),
+                         [True, False])
+        self.assertEqual(pip.exists_all(packages, [tempdir]),
+                         [False, False])
+        self.assertEqual(
+            [pip.exists(package, self.temprepo) for package in packages],
+            [True, False]
+        )
+
     def test_existing_variant(self):
         """Test installing another variant"""
 
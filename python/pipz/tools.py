@@ -0,0 +1,18 @@
+"""Commands of pipz other than installing packages
+
+Usage:
+    $ python -m pipz.tools wheelhouse build /mnt/wheels
+    $ python -m pipz.tools convert-wheelhouse /mnt/wheels
+    $ python -m pipz.tools serve
+    $ python -m pipz.tools verify six
+    $ python -m pipz.tools repair six
+
+Every argument of `python -m pipz` is a package to install.
+
+"""
+
+import sys
+from . import cli
+
+if __name__ == "__main__":
+    sys.exit(cli.tools(sys.argv))
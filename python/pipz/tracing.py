@@ -0,0 +1,149 @@
+"""Record where time goes during an install
+
+Spans are written as they finish, either as one JSON object per line
+
+    {"name": "deploy", "start": 1570000000.1, "duration": 0.25, ...}
+
+or in the Chrome trace-event format, for chrome://tracing and Perfetto.
+
+Usage:
+    >>> start("trace.jsonl")
+    >>> with span("deploy", package="six") as attrs:
+    ...     attrs["files"] = 3
+    >>> stop()
+
+Tracing is off unless started, in which case `span` costs next to nothing.
+
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+_tracer = None
+
+
+class Tracer(object):
+    """Write spans to `fname`, safe to use from multiple threads
+
+    Arguments:
+        fname (str): Absolute path to output file, overwritten if exists
+        format (str, optional): Either "jsonl" or "chrome"
+
+    """
+
+    def __init__(self, fname, format="jsonl"):
+        assert format in ("jsonl", "chrome"), "Unsupported format %s" % format
+
+        self.format = format
+        self._file = open(fname, "w")
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+        if format == "chrome":
+            # The closing bracket is optional, as per the specification
+            self._file.write("[\n")
+
+    def write(self, name, start, duration, attrs):
+        if self.format == "chrome":
+            record = {
+                "name": name,
+                "ph": "X",
+                "ts": int(start * 10 ** 6),
+                "dur": int(duration * 10 ** 6),
+                "pid": self._pid,
+                "tid": threading.current_thread().ident,
+                "args": attrs,
+            }
+            line = json.dumps(record, default=str) + ",\n"
+
+        else:
+            record = dict(attrs)
+            record.update({
+                "name": name,
+                "start": start,
+                "duration": duration,
+                "thread": threading.current_thread().name,
+            })
+            line = json.dumps(record, default=str) + "\n"
+
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def start(fname, format="jsonl"):
+    """Start writing spans to `fname`"""
+    global _tracer
+    stop()
+    _tracer = Tracer(fname, format)
+
+
+def stop():
+    global _tracer
+
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time the enclosed block, recording `attrs` alongside it
+
+    The yielded dictionary may be amended with attributes only
+    known once the block has run, e.g. number of files copied.
+    Peak memory use of this process, and of any finished child
+    processes such as pip, is added on completion.
+
+    """
+
+    if _tracer is None:
+        yield attrs
+        return
+
+    t0 = time.time()
+
+    try:
+        yield attrs
+
+    except Exception as e:
+        attrs["error"] = str(e)
+        raise
+
+    finally:
+        attrs.update(peak_rss())
+
+        tracer = _tracer
+        if tracer is not None:
+            tracer.write(name, t0, time.time() - t0, attrs)
+
+
+def peak_rss():
+    """Return peak resident memory in bytes, of us and our children"""
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return {}
+
+    # Kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+
+    return {
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "peak_rss_children": (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        ),
+    }
@@ -0,0 +1,152 @@
+"""Serve a directory of wheels as a PEP 503 simple repository
+
+For machines without internet access, a directory of wheels is turned
+into a static index that pip reads straight from disk.
+
+Layout:
+    {directory}/six-1.12.0-py2.py3-none-any.whl
+    {directory}/simple/index.html
+    {directory}/simple/six/index.html
+
+https://www.python.org/dev/peps/pep-0503/
+
+"""
+
+import os
+import re
+import hashlib
+import zipfile
+import logging
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+_log = logging.getLogger("pipz")
+
+page = """\
+<!DOCTYPE html>
+<html>
+  <head>
+    <meta name="pypi:repository-version" content="1.0">
+    <title>{title}</title>
+  </head>
+  <body>
+{links}
+  </body>
+</html>
+"""
+
+
+def normalize(name):
+    """Return PEP 503 normalised project `name`, e.g. Foo.Bar -> foo-bar"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def index_url(directory):
+    """Return URL pip may use as --index-url for `directory`"""
+    try:
+        from urllib.request import pathname2url
+        from urllib.parse import urljoin
+    except ImportError:
+        from urllib import pathname2url
+        from urlparse import urljoin
+
+    simple = os.path.join(os.path.abspath(directory), "simple")
+    return urljoin("file:", pathname2url(simple)) + "/"
+
+
+def build(directory):
+    """Write a PEP 503 simple index for each wheel in `directory`
+
+    Arguments:
+        directory (str): Absolute path to directory of .whl files
+
+    Returns:
+        projects (dict): Normalised project name to list of wheel filenames
+
+    """
+
+    projects = dict()
+
+    for fname in sorted(os.listdir(directory)):
+        if not fname.endswith(".whl"):
+            continue
+
+        # {distribution}-{version}(-{build})?-{python}-{abi}-{platform}.whl
+        name = normalize(fname.split("-", 1)[0])
+        projects.setdefault(name, []).append(fname)
+
+    simple = os.path.join(directory, "simple")
+
+    for name, fnames in projects.items():
+        links = list()
+
+        for fname in fnames:
+            path = os.path.join(directory, fname)
+            attrs = ""
+
+            requires_python = _requires_python(path)
+            if requires_python:
+                attrs = ' data-requires-python="%s"' % escape(
+                    requires_python, quote=True)
+
+            links.append('    <a href="../../%s#sha256=%s"%s>%s</a><br/>' % (
+                fname, _sha256(path), attrs, fname
+            ))
+
+        _write(os.path.join(simple, name, "index.html"), page.format(
+            title="Links for %s" % name,
+            links="\n".join(links),
+        ))
+
+    _write(os.path.join(simple, "index.html"), page.format(
+        title="Simple index",
+        links="\n".join(
+            '    <a href="%s/">%s</a><br/>' % (name, name)
+            for name in sorted(projects)
+        )
+    ))
+
+    return projects
+
+
+def _sha256(fname, chunk_size=2 ** 20):
+    sha = hashlib.sha256()
+
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def _requires_python(fname):
+    """Read Requires-Python from METADATA within wheel `fname`"""
+    import email
+
+    try:
+        with zipfile.ZipFile(fname) as whl:
+            for member in whl.namelist():
+                parts = member.split("/")
+
+                if len(parts) == 2 and (
+                        parts[0].endswith(".dist-info") and
+                        parts[1] == "METADATA"):
+                    metadata = whl.read(member).decode("utf-8")
+                    return email.message_from_string(metadata).get(
+                        "Requires-Python")
+
+    except (zipfile.BadZipfile, IOError, OSError) as e:
+        _log.warning("Could not read %s: %s" % (fname, e))
+
+
+def _write(fname, content):
+    dirname = os.path.dirname(fname)
+
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    with open(fname, "w") as f:
+        f.write(content)